@@ -1,56 +1,188 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from collections import OrderedDict, deque
+import asyncio
+import httpx
+import hashlib
 import os
 import re
+import time
+import config
+from ai_guard import AIUnavailableError, get_guard
+
+MODEL = config.AI_MODEL
+API_KEY = config.AI_API_KEY
+BASE_URL = config.AI_BASE_URL
+# QuestionChecker's answer when the model reply could not be parsed.
+BUSY_MESSAGE = "AI API was busy"
+DEFAULT_HEADERS = {
+    "HTTP-Referer": "http://localhost:3000",  
+    "X-Title": "Code Evaluator", 
+}
 
 def getAPI():
     return OpenAI(
-            api_key="your-openai-api-key", 
-            base_url="https://openrouter.ai/api/v1",
-            default_headers={
-                "HTTP-Referer": "http://localhost:3000",  
-                "X-Title": "Code Evaluator", 
-            }
+            api_key=API_KEY, 
+            base_url=BASE_URL,
+            default_headers=DEFAULT_HEADERS
         )
 
+_async_client = None
+
+def getAsyncAPI():
+    """One AsyncOpenAI client, and so one pooled HTTP connection pool, for the whole app"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=API_KEY,
+            base_url=BASE_URL,
+            default_headers=DEFAULT_HEADERS,
+            max_retries=config.AI_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                timeout=httpx.Timeout(config.AI_TIMEOUT, connect=config.AI_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=config.AI_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.AI_MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
+        )
+    return _async_client
+
+async def close_async_api():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+def compact_prompt(text:str):
+    """Drop the source indentation triple-quoted prompts pick up; it is paid for as tokens on every call"""
+    return "\n".join(line.strip() for line in text.strip().splitlines())
+
+
+def estimate_tokens(text:str):
+    # About four characters per token for English and code, close enough for budgeting.
+    return len(text) // 4 + 1 if text else 0
+
+
+def fit_submission(code:str, budget:int):
+    """The code cut to about budget tokens by keeping its beginning and end"""
+    if estimate_tokens(code) <= budget:
+        return code
+    keep = budget * 4 // 2
+    head, tail = code[:keep], code[-keep:]
+    if "\n" in head:
+        head = head.rsplit("\n", 1)[0]
+    if "\n" in tail:
+        tail = tail.split("\n", 1)[1]
+    omitted = code.count("\n") - head.count("\n") - tail.count("\n")
+    omitted = f"{omitted} lines" if omitted > 0 else f"{len(code) - len(head) - len(tail)} characters"
+    return f"{head}\n... [{omitted} omitted to fit the grading budget] ...\n{tail}"
+
+
+_USAGE = {}#purpose -> totals
+_RECENT_USAGE = deque(maxlen=config.AI_USAGE_HISTORY)
+
+def record_usage(purpose, request, usage=None, completion=""):
+    """Token counts reported by the provider, or estimated when it does not report them"""
+    if usage is not None:
+        prompt_tokens, completion_tokens, estimated = usage.prompt_tokens, usage.completion_tokens, False
+    else:
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in request["messages"])
+        completion_tokens = estimate_tokens(completion or "")
+        estimated = True
+    totals = _USAGE.setdefault(purpose, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+    totals["calls"] += 1
+    totals["prompt_tokens"] += prompt_tokens
+    totals["completion_tokens"] += completion_tokens
+    _RECENT_USAGE.append({
+        "purpose": purpose,
+        "time": time.time(),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "estimated": estimated
+    })
+
+def usage_stats():
+    return {"totals": _USAGE, "recent": list(_RECENT_USAGE)}
+
+EVALUATION_PROMPT = compact_prompt("""
+    You are an expert {language} programming instructor evaluating student code submissions.
+
+    You are given:
+    - Question: {question}
+    - Reference Solution: {reference_code}
+    - Student Submission: {student_code}
+    - Restricted Technologies: {restricted_things} (if None, no restrictions apply)
+    - Total Score: {total_score}
+
+    Your evaluation rules:
+
+    1. A solution is acceptable even if it uses a completely different approach from the reference, as long as it produces correct results and satisfies the requirements.
+    2. Focus strictly on:
+    - correctness
+    - logic
+    - requirement satisfaction
+    - compliance with restrictions
+    3. If the student uses any restricted technology, the score must be 0.
+    4. If the solution does **not** fulfill the main problem requirement, score must be 0.
+    5. If the score is less than full marks, list every mistake clearly.
+    6. Comments are only for situations where the solution is technically correct but contains informal or questionable practices.
+    7. Your response must be **ONLY** in the following format — nothing else:
+
+    (score, mistakes, comments)
+
+    Where:
+    - score → integer from 0 to {total_score}
+    - mistakes → "None" if no mistakes, otherwise a single string describing mistakes
+    - comments → "None" if no comments, otherwise a single string describing comments
+
+    Do NOT include any extra wording or explanation outside this format.
+""")
+
+EVALUATION_SYSTEM_PROMPT = "You are an expert programming instructor who provides constructive, detailed feedback on code submissions. You evaluate code fairly, recognizing that multiple correct solutions exist for most problems."
+
 class CodeEvaluator:
     def __init__(self):
         self.client=getAPI()
     
     def create_prompt(self, question:str, reference_code:str,student_code:str,  language:str, restricted_things:str, total_score:int):
-    
-        return f"""You are an expert {language} programming instructor evaluating student code submissions.
-
-                    You are given:
-                    - Question: {question}
-                    - Reference Solution: {reference_code}
-                    - Student Submission: {student_code}
-                    - Restricted Technologies: {restricted_things} (if None, no restrictions apply)
-                    - Total Score: {total_score}
-
-                    Your evaluation rules:
-
-                    1. A solution is acceptable even if it uses a completely different approach from the reference, as long as it produces correct results and satisfies the requirements.
-                    2. Focus strictly on:
-                    - correctness
-                    - logic
-                    - requirement satisfaction
-                    - compliance with restrictions
-                    3. If the student uses any restricted technology, the score must be 0.
-                    4. If the solution does **not** fulfill the main problem requirement, score must be 0.
-                    5. If the score is less than full marks, list every mistake clearly.
-                    6. Comments are only for situations where the solution is technically correct but contains informal or questionable practices.
-                    7. Your response must be **ONLY** in the following format — nothing else:
-
-                    (score, mistakes, comments)
-
-                    Where:
-                    - score → integer from 0 to {total_score}
-                    - mistakes → "None" if no mistakes, otherwise a single string describing mistakes
-                    - comments → "None" if no comments, otherwise a single string describing comments
-
-                    Do NOT include any extra wording or explanation outside this format.
-
-                    """
+        return EVALUATION_PROMPT.format(
+            language=language, question=question, reference_code=reference_code,
+            student_code=student_code, restricted_things=restricted_things, total_score=total_score
+        )
+
+    def _request(self, question:str, reference_code:str,student_code:str,  language:str, restricted_things:str, total_score:int, run_note:str=None):
+        student_code=fit_submission(student_code, config.AI_SUBMISSION_TOKEN_BUDGET)
+        evaluation_prompt=self.create_prompt(question, reference_code,student_code,language,restricted_things,total_score)
+        if run_note:
+            evaluation_prompt+=f"\n\nSandbox run of the student's code (a hint only, grade the code itself): {run_note}"
+        return dict(
+            model=MODEL, 
+            messages=[
+                {
+                    "role": "system",
+                    "content": EVALUATION_SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": evaluation_prompt
+                }
+            ],
+            temperature=0.3,
+            max_tokens=100
+        )
+
+    def _parse(self, response_data:str):
+        pattern = r"\(\s*(\d+)\s*,\s*(None|\".*?\"|'.*?'|[^,]+)\s*,\s*(None|\".*?\"|'.*?'|[^)]+)\s*\)"
+        match = re.match(pattern, response_data.strip())
+        if not match:
+            raise ValueError("AI response not in expected format (score, mistakes, comments)")
+
+        score = int(match.group(1))
+        mistakes = match.group(2).strip()
+        comments = match.group(3).strip()
+        
+        return [score, mistakes, comments]
                     
     def evaluate_code(self, question:str, reference_code:str,student_code:str,  language:str, restricted_things:str=None, total_score:int=10):
             if not all([question , reference_code, student_code]):
@@ -58,38 +190,91 @@ class CodeEvaluator:
             
             
             try:
-                evaluation_prompt=self.create_prompt(question, reference_code,student_code,language,restricted_things,total_score)
-                response = self.client.chat.completions.create(
-                model="google/gemini-2.5-flash-lite", 
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert programming instructor who provides constructive, detailed feedback on code submissions. You evaluate code fairly, recognizing that multiple correct solutions exist for most problems."
-                    },
-                    {
-                        "role": "user",
-                        "content": evaluation_prompt
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=100
-            )
-                
-                response_data=response.choices[0].message.content
-                pattern = r"\(\s*(\d+)\s*,\s*(None|\".*?\"|'.*?'|[^,]+)\s*,\s*(None|\".*?\"|'.*?'|[^)]+)\s*\)"
-                match = re.match(pattern, response_data.strip())
-                if not match:
-                    raise ValueError("AI response not in expected format (score, mistakes, comments)")
-
-                score = int(match.group(1))
-                mistakes = match.group(2).strip()
-                comments = match.group(3).strip()
-                
-                return [score, mistakes, comments]
+                request = self._request(question, reference_code,student_code,language,restricted_things,total_score)
+                response = self.client.chat.completions.create(**request)
+                record_usage("grading", request, response.usage, response.choices[0].message.content)
+                return self._parse(response.choices[0].message.content)
+            except Exception as e:
+                return [0,None,"Something wrong with AI response"]
+
+
+class AsyncCodeEvaluator(CodeEvaluator):
+    def __init__(self):
+        self.client=getAsyncAPI()
+
+    async def grade(self, question:str, reference_code:str,student_code:str,  language:str, restricted_things:str=None, total_score:int=10, run_note:str=None):
+            """Same as evaluate_code, but API and format errors are raised so the caller can retry"""
+            if not all([question , reference_code, student_code]):
+                return [0,None,"No answer submitted"]
+            
+            request = self._request(question, reference_code,student_code,language,restricted_things,total_score,run_note)
+            response = await get_guard().call(lambda: self.client.chat.completions.create(**request), config.AI_GRADING_DEADLINE)
+            record_usage("grading", request, response.usage, response.choices[0].message.content)
+            return self._parse(response.choices[0].message.content)
+
+    async def evaluate_code(self, question:str, reference_code:str,student_code:str,  language:str, restricted_things:str=None, total_score:int=10):
+            try:
+                return await self.grade(question, reference_code,student_code,language,restricted_things,total_score)
             except Exception as e:
                 return [0,None,"Something wrong with AI response"]
         
 
+TUTOR_INSTRUCTIONS = {
+    "exercise": compact_prompt("""
+        Provide 2-3 practice problems related to this course topic. Make them progressively harder. Include:
+        - Problem statement in plain text
+        - Expected approach or solution hints
+        - Difficulty level (Easy/Medium/Hard)
+        Problems must be appropriate for the course.
+    """),
+    "resources": compact_prompt("""
+        Provide 2-4 legitimate educational links about the topic. Include a brief explanation for each.
+        Allowed sources: Khan Academy, Wikipedia, GeeksforGeeks, Visualgo, YouTube educational channels, GitHub repositories.
+        Only provide links relevant to the course topic.
+    """),
+    "notes": compact_prompt("""
+        Provide clear, well-organized notes in plain text.
+        Include main points, definitions, and key ideas.
+        Use line breaks to separate ideas. No symbols, bullets, or markdown.
+    """),
+    "explanation": compact_prompt("""
+        Provide a clear, intermediate-level explanation.
+        Include:
+        - Simple definition of the topic
+        - How it works with a practical example
+        - Why it matters in this course
+        Keep explanations plain text, natural, and conversational.
+    """),
+}
+
+TUTOR_SYSTEM_PROMPT = compact_prompt("""
+    You are an educational assistant for the course: {course_name}
+
+    {type_instruction}
+
+    RESPONSE FORMAT RULES:
+    - Plain text ONLY
+    - No asterisks (*), hash marks (#), underscores (_), bullets, or code fences
+    - Use simple line breaks to separate paragraphs
+    - Keep tone friendly and supportive
+    - Provide visualization links [VISUALIZATION: name - url] only if truly helpful
+
+    BEHAVIOR RULES:
+    - Answer questions related to {course_name}
+    - If the question is unrelated to this course, respond: "This question is not related to {course_name}."
+    - Be helpful, clear, and concise
+""")
+
+TUTOR_USER_PROMPT = compact_prompt("""
+    COURSE: {course_name}
+    STUDENT QUESTION: {student_question}
+
+    INSTRUCTIONS:
+    - Provide a complete, plain text answer
+    - Keep response appropriate for the course level
+    - Approximate length: {max_tokens} tokens
+""")
+
 class TeacherAssistant:
     def __init__(self):
         self.client = getAPI()
@@ -134,86 +319,45 @@ class TeacherAssistant:
         
         return min(base_tokens, 1200)
 
-    def chat(self, student_question: str, course_name: str) -> str:
-       
+    def _request(self, student_question: str, course_name: str):
+        question_type = self._detect_question_type(student_question)
+        max_tokens = self._calculate_dynamic_max_tokens(student_question, question_type)
+
+        type_instruction = TUTOR_INSTRUCTIONS.get(question_type, TUTOR_INSTRUCTIONS["explanation"])
+        system_prompt = TUTOR_SYSTEM_PROMPT.format(course_name=course_name, type_instruction=type_instruction)
+        user_prompt = TUTOR_USER_PROMPT.format(course_name=course_name, student_question=student_question, max_tokens=max_tokens)
+
+        return dict(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.7,
+            max_tokens=max_tokens
+        )
+
+    def _check_input(self, student_question: str, course_name: str):
         if not student_question or not student_question.strip():
             return "AI receives no question"
             
         
         if not course_name or not course_name.strip():
             return "AI receives no question"
+        return None
+
+    def chat(self, student_question: str, course_name: str) -> str:
+       
+        problem = self._check_input(student_question, course_name)
+        if problem:
+            return problem
         
         try:
-            question_type = self._detect_question_type(student_question)
-            max_tokens = self._calculate_dynamic_max_tokens(student_question, question_type)
-
-            self.conversation_history.append({
-                "role": "user",
-                "content": student_question,
-                "type": question_type,
-                "course": course_name
-            })
-
-            if question_type == "exercise":
-                type_instruction = """Provide 2-3 practice problems related to this course topic. Make them progressively harder. Include:
-                                    - Problem statement in plain text
-                                    - Expected approach or solution hints
-                                    - Difficulty level (Easy/Medium/Hard)
-                                    Problems must be appropriate for the course."""
-                
-            elif question_type == "resources":
-                type_instruction = """Provide 2-4 legitimate educational links about the topic. Include a brief explanation for each.
-                                    Allowed sources: Khan Academy, Wikipedia, GeeksforGeeks, Visualgo, YouTube educational channels, GitHub repositories.
-                                    Only provide links relevant to the course topic."""
-                
-            elif question_type == "notes":
-                type_instruction = """Provide clear, well-organized notes in plain text.
-                                    Include main points, definitions, and key ideas.
-                                    Use line breaks to separate ideas. No symbols, bullets, or markdown."""
-                
-            else:  
-                type_instruction = """Provide a clear, intermediate-level explanation.
-                                    Include:
-                                    - Simple definition of the topic
-                                    - How it works with a practical example
-                                    - Why it matters in this course
-                                    Keep explanations plain text, natural, and conversational."""
-
-            system_prompt = f"""You are an educational assistant for the course: {course_name}
-
-                                {type_instruction}
-
-                                RESPONSE FORMAT RULES:
-                                - Plain text ONLY
-                                - No asterisks (*), hash marks (#), underscores (_), bullets, or code fences
-                                - Use simple line breaks to separate paragraphs
-                                - Keep tone friendly and supportive
-                                - Provide visualization links [VISUALIZATION: name - url] only if truly helpful
-
-                                BEHAVIOR RULES:
-                                - Answer questions related to {course_name}
-                                - If the question is unrelated to this course, respond: "This question is not related to {course_name}."
-                                - Be helpful, clear, and concise"""
-
-            user_prompt = f"""COURSE: {course_name}
-                            STUDENT QUESTION: {student_question}
-
-                            INSTRUCTIONS:
-                            - Provide a complete, plain text answer
-                            - Keep response appropriate for the course level
-                            - Approximate length: {max_tokens} tokens"""
-
-            response = self.client.chat.completions.create(
-                model="google/gemini-2.5-flash-lite",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=max_tokens
-            )
+            request = self._request(student_question, course_name)
+            response = self.client.chat.completions.create(**request)
 
             answer = response.choices[0].message.content
+            record_usage("tutor", request, response.usage, answer)
             
 
             return answer
@@ -224,69 +368,222 @@ class TeacherAssistant:
             print(f"Warning: Error processing question: {e}")
             return "Sorry, there was a problem processing your question. Please try again."
 
+
+def normalize_question(question:str):
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+
+class AnswerInterrupted(Exception):
+    """The tutor's answer failed after part of it was already streamed"""
+
+
+class AsyncTeacherAssistant(TeacherAssistant):
+    def __init__(self):
+        self.client = getAsyncAPI()
+        self.answers = {}#course name -> OrderedDict of (question type, normalized question) -> (expiry time, answer)
+        self.in_flight = {}#(course name, question type, normalized question) -> task asking the model
+        self.stats = {}#course name -> lookup counters
+
+    def _cached(self, course_name, key):
+        answers = self.answers.get(course_name)
+        entry = answers.get(key) if answers else None
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del answers[key]
+            return None
+        answers.move_to_end(key)
+        return entry[1]
+
+    def _remember(self, course_name, key, answer):
+        answers = self.answers.setdefault(course_name, OrderedDict())
+        answers[key] = (time.monotonic() + config.CHAT_CACHE_TTL, answer)
+        answers.move_to_end(key)
+        while len(answers) > config.CHAT_CACHE_SIZE:
+            answers.popitem(last=False)
+
+    async def _ask(self, student_question, course_name, key):
+        request = self._request(student_question, course_name)
+        response = await get_guard().call(lambda: self.client.chat.completions.create(**request), config.AI_TUTOR_DEADLINE)
+        answer = response.choices[0].message.content
+        record_usage("tutor", request, response.usage, answer)
+        if answer:
+            self._remember(course_name, key, answer)
+        return answer
+
+    async def chat(self, student_question: str, course_name: str) -> str:
+        """Answers are cached per course, and identical questions asked at the same time share one model call"""
+        problem = self._check_input(student_question, course_name)
+        if problem:
+            return problem
+
+        key = (self._detect_question_type(student_question), normalize_question(student_question))
+        stats = self.stats.setdefault(course_name, {"hits": 0, "misses": 0, "coalesced": 0})
+        answer = self._cached(course_name, key)
+        if answer is not None:
+            stats["hits"] += 1
+            return answer
+
+        flight = (course_name,) + key
+        task = self.in_flight.get(flight)
+        if task is None:
+            stats["misses"] += 1
+            task = asyncio.ensure_future(self._ask(student_question, course_name, key))
+            self.in_flight[flight] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(flight, None))
+        else:
+            stats["coalesced"] += 1
+
+        try:
+            # Shielded so a student leaving the page does not cancel the call others are waiting on.
+            return await asyncio.shield(task)
+        except Exception as e:
+            print(f"Warning: Error processing question: {e}")
+            return "Sorry, there was a problem processing your question. Please try again."
+
+    async def stream_chat(self, student_question: str, course_name: str):
+        """Yields the answer in pieces as the model produces it; cached and coalesced the same way as chat.
+
+        Raises AnswerInterrupted when the model fails after some pieces were yielded.
+        """
+        problem = self._check_input(student_question, course_name)
+        if problem:
+            yield problem
+            return
+
+        key = (self._detect_question_type(student_question), normalize_question(student_question))
+        stats = self.stats.setdefault(course_name, {"hits": 0, "misses": 0, "coalesced": 0})
+        answer = self._cached(course_name, key)
+        if answer is not None:
+            stats["hits"] += 1
+            yield answer
+            return
+
+        flight = (course_name,) + key
+        task = self.in_flight.get(flight)
+        if task is not None:
+            stats["coalesced"] += 1
+            try:
+                yield await asyncio.shield(task)
+            except Exception as e:
+                print(f"Warning: Error processing question: {e}")
+                yield "Sorry, there was a problem processing your question. Please try again."
+            return
+
+        stats["misses"] += 1
+        # Questions asked while this one streams wait for the whole answer.
+        shared = asyncio.get_running_loop().create_future()
+        self.in_flight[flight] = shared
+        parts = []
+        try:
+            request = self._request(student_question, course_name)
+            stream = await get_guard().call(
+                lambda: self.client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True}),
+                config.AI_TUTOR_DEADLINE
+            )
+            usage = None
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            answer = "".join(parts)
+            record_usage("tutor", request, usage, answer)
+            if answer:
+                self._remember(course_name, key, answer)
+            shared.set_result(answer)
+        except Exception as e:
+            print(f"Warning: Error processing question: {e}")
+            shared.set_exception(e)
+            shared.exception()
+            if parts:
+                raise AnswerInterrupted("Sorry, there was a problem processing your question. Please try again.") from e
+            yield "Sorry, there was a problem processing your question. Please try again."
+            return
+        finally:
+            self.in_flight.pop(flight, None)
+            if not shared.done():
+                shared.set_exception(RuntimeError("answer stream was closed before it finished"))
+                shared.exception()
+
+    def cache_stats(self, course_names=None):
+        result = {}
+        for course_name, stats in self.stats.items():
+            if course_names is not None and course_name not in course_names:
+                continue
+            lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+            result[course_name] = dict(
+                stats,
+                entries=len(self.answers.get(course_name, ())),
+                hit_rate=round((stats["hits"] + stats["coalesced"]) / lookups * 100, 1) if lookups else 0
+            )
+        return result
+
+QUESTION_CHECK_PROMPT = compact_prompt("""
+    You are a Quiz Validation AI.
+    Your task is to check whether the provided quiz question, sample output, and course restriction are logically consistent and suitable for quiz creation.
+
+    Given:
+    - course_name: the course the quiz belongs to
+    - question: the quiz question text
+    - sample_output: the expected example answer(if not provided, suggest sample_output)
+    - restriction: any constraints (e.g., data types, allowed operations, input limits)
+
+    You must analyze the following:
+
+    1. **Course Relevance**
+    - Check if the question is related to the course.
+    Example: If course = "Mathematics" but the question is about "Python programming", then it's invalid.
+
+    2. **Question–Output Alignment**
+    - Check if the sample output is realistic and logically possible given the question.
+    - Detect contradictions, impossible outputs, missing steps, or wrong formats.
+
+    3. **Restriction Compatibility**
+    - Check if the question and sample output follow the stated restrictions.
+    - If restrictions contradict the question/output (e.g., "no loops allowed" but the task requires loops), mark invalid.
+
+    4. **Quality Check**
+    - Identify minor issues such as grammar mistakes, unclear wording, or missing information.
+
+    ### ✅ Required Response Format
+
+    Respond strictly in this format:
+    [True, suggestions] If everything is valid.
+    Or:
+    [False, explanation or suggestions]
+    Where suggestions may include:
+    - wrong course
+    - wrong or impossible sample output
+    - mismatch between question and output
+    - unclear question
+    - violation of restriction
+    - minor mistakes detected
+    ### The response must always be:
+    [boolean, suggestion]
+""")
+
+QUESTION_CHECK_USER_PROMPT = compact_prompt("""
+    course_name : {course}
+    question :{question}
+    sample_output:{sample_outputs}
+    restrictions : {restrctions}
+""")
+
 class QuestionChecker:
         def __init__(self):
             self.client = getAPI()
         
-        def check(self, question:str, course, sample_outputs="not provided", restrctions="not provided"):
-            if not question.strip():
-                return {"correct":False, "message":"Qustion should not be empty"}
-            
-            system_prompt="""You are a Quiz Validation AI. 
-                            Your task is to check whether the provided quiz question, sample output, and course restriction are logically consistent and suitable for quiz creation.
-
-                            Given:
-                            - course_name: the course the quiz belongs to
-                            - question: the quiz question text
-                            - sample_output: the expected example answer(if not provided, suggest sample_output)
-                            - restriction: any constraints (e.g., data types, allowed operations, input limits)
-
-                            You must analyze the following:
-
-                            1. **Course Relevance**  
-                            - Check if the question is related to the course.  
-                            Example: If course = "Mathematics" but the question is about "Python programming", then it's invalid.
-
-                            2. **Question–Output Alignment**  
-                            - Check if the sample output is realistic and logically possible given the question.
-                            - Detect contradictions, impossible outputs, missing steps, or wrong formats.
-
-                            3. **Restriction Compatibility**  
-                            - Check if the question and sample output follow the stated restrictions.
-                            - If restrictions contradict the question/output (e.g., "no loops allowed" but the task requires loops), mark invalid.
-
-                            4. **Quality Check**  
-                            - Identify minor issues such as grammar mistakes, unclear wording, or missing information.
-
-                            ### ✅ Required Response Format
-
-                            Respond strictly in this format:
-                            [True, suggestions] If everything is valid.
-                            Or:
-                            [False, explanation or suggestions]
-                            Where suggestions may include:
-                            - wrong course
-                            - wrong or impossible sample output
-                            - mismatch between question and output
-                            - unclear question
-                            - violation of restriction
-                            - minor mistakes detected
-                            ### The response must always be:
-                            [boolean, suggestion]
-                            """
-                            
-                            
-            user_prompt=f"""course_name : {course}
-                            question :{question} 
-                            sample_output:{sample_outputs}
-                            restrictions : {restrctions}"""
+        def _request(self, question:str, course, sample_outputs="not provided", restrctions="not provided"):
+            user_prompt=QUESTION_CHECK_USER_PROMPT.format(course=course, question=question, sample_outputs=sample_outputs, restrctions=restrctions)
                             
-            response = self.client.chat.completions.create(
-                        model="google/gemini-2.5-flash-lite",
+            return dict(
+                        model=MODEL,
                         messages=[
                         {
                             "role": "system",
-                            "content": system_prompt
+                            "content": QUESTION_CHECK_PROMPT
                         },
                         {
                             "role": "user",
@@ -296,9 +593,8 @@ class QuestionChecker:
                         temperature=0.7,
                         max_tokens=100
                 )
-            
-            raw = response.choices[0].message.content.strip()
 
+        def _parse(self, raw:str):
             match = re.match(r"\[(True|False)\s*,\s*(.*)\]", raw, re.DOTALL)
                 
             if match:
@@ -306,7 +602,61 @@ class QuestionChecker:
                 message = match.group(2)
             else:
                 is_correct = False
-                message = "AI API was busy"
+                message = BUSY_MESSAGE
 
             return {"correct": is_correct, "message": message}
-        
+
+        def check(self, question:str, course, sample_outputs="not provided", restrctions="not provided"):
+            if not question.strip():
+                return {"correct":False, "message":"Qustion should not be empty"}
+            
+            request = self._request(question, course, sample_outputs, restrctions)
+            response = self.client.chat.completions.create(**request)
+            record_usage("question_check", request, response.usage, response.choices[0].message.content)
+            return self._parse(response.choices[0].message.content.strip())
+
+
+class AsyncQuestionChecker(QuestionChecker):
+        def __init__(self):
+            self.client = getAsyncAPI()
+            self.verdicts = {}#hash of the inputs -> (expiry time, result)
+
+        def _key(self, question, course, sample_outputs, restrctions):
+            # validate sends JSON and create_quiz a form post, so line endings, padding and a blank restriction differ.
+            def canonical(text):
+                return str(text or "").replace("\r\n", "\n").replace("\r", "\n").strip()
+            restrctions = canonical(restrctions)
+            if restrctions.lower() in ("", "none"):
+                restrctions = "None"
+            parts = (canonical(course), canonical(question), canonical(sample_outputs), restrctions)
+            return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+        def _remember(self, key, result):
+            now = time.monotonic()
+            for k in [k for k, (expiry, _) in self.verdicts.items() if expiry <= now]:
+                del self.verdicts[k]
+            while len(self.verdicts) >= config.QUESTION_CHECK_CACHE_SIZE:
+                del self.verdicts[next(iter(self.verdicts))]
+            self.verdicts[key] = (now + config.QUESTION_CHECK_TTL, result)
+
+        async def check(self, question:str, course, sample_outputs="not provided", restrctions="not provided"):
+            """Verdicts are reused for QUESTION_CHECK_TTL seconds, so create_quiz does not repeat validate's check"""
+            if not question.strip():
+                return {"correct":False, "message":"Qustion should not be empty"}
+
+            key = self._key(question, course, sample_outputs, restrctions)
+            cached = self.verdicts.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                return dict(cached[1])
+            
+            request = self._request(question, course, sample_outputs, restrctions)
+            try:
+                response = await get_guard().call(lambda: self.client.chat.completions.create(**request), config.AI_CHECK_DEADLINE)
+            except AIUnavailableError as e:
+                print(f"Warning: question check skipped: {e}")
+                return {"correct": False, "message": BUSY_MESSAGE}
+            record_usage("question_check", request, response.usage, response.choices[0].message.content)
+            result = self._parse(response.choices[0].message.content.strip())
+            if result["message"] != BUSY_MESSAGE:
+                self._remember(key, dict(result))
+            return result
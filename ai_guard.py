@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import openai
+
+import config
+
+
+class AIUnavailableError(Exception):
+    """The provider was skipped because it is unhealthy, or did not answer before the deadline"""
+
+
+def is_upstream_failure(error):
+    """Errors that say the provider is unhealthy, as opposed to a bad request or an unusable reply"""
+    if isinstance(error, (AIUnavailableError, asyncio.TimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold upstream failures in a row and rejects calls for reset_timeout
+    seconds; then lets one trial call through, which closes it again or reopens it."""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0
+        self.trial_running = False
+
+    def allow(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.trial_running:
+                return False
+            self.trial_running = True
+        return True
+
+    def retry_after(self):
+        if self.state == "closed":
+            return 0
+        return max(0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.trial_running = False
+
+    def failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def abandon(self):
+        # A cancelled trial call settles nothing; let the next call try instead.
+        self.trial_running = False
+
+
+class UpstreamGuard:
+    def __init__(self):
+        self.bucket = TokenBucket(config.AI_RATE_LIMIT, config.AI_RATE_BURST)
+        self.breaker = CircuitBreaker(config.AI_BREAKER_FAILURES, config.AI_BREAKER_RESET)
+        self.rejected = 0
+
+    async def call(self, make_call, deadline):
+        """Await make_call() within the rate limit and deadline, unless the breaker is open"""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise AIUnavailableError(f"AI provider is unavailable, retrying in {self.breaker.retry_after():.0f}s")
+        try:
+            await self.bucket.acquire()
+            result = await asyncio.wait_for(make_call(), deadline)
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        except asyncio.TimeoutError as e:
+            self.breaker.failure()
+            raise AIUnavailableError(f"AI provider did not answer within {deadline:g}s") from e
+        except Exception as e:
+            if is_upstream_failure(e):
+                self.breaker.failure()
+            else:
+                self.breaker.success()
+            raise
+        self.breaker.success()
+        return result
+
+    def status(self):
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retry_after": round(self.breaker.retry_after(), 1),
+            "rejected_calls": self.rejected,
+            "tokens_available": round(self.bucket.tokens, 2)
+        }
+
+
+_guard = None
+
+def get_guard():
+    """One guard for every AI class, so they share the provider quota and its health"""
+    global _guard
+    if _guard is None:
+        _guard = UpstreamGuard()
+    return _guard
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict
+
+from ZODB.POSException import ConflictError
+import config
+import database
+import globals
+from models import AnalysisClaim
+
+
+class AnalysisJob:
+    def __init__(self, quiz_id):
+        self.quiz_id = quiz_id
+        self.status = "queued"
+        self.pairs_done = 0
+        self.pairs_total = 0
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.rerun = False
+        self.task = None
+
+    def update(self, pairs_done, pairs_total):
+        self.pairs_done = pairs_done
+        self.pairs_total = pairs_total
+
+    def percentage(self):
+        if self.status == "done":
+            return 100
+        if self.pairs_total == 0:
+            return 0
+        return round(self.pairs_done / self.pairs_total * 100)
+
+    def snapshot(self):
+        return {
+            "quiz_id": self.quiz_id,
+            "status": self.status,
+            "pairs_done": self.pairs_done,
+            "pairs_total": self.pairs_total,
+            "percentage": self.percentage(),
+            "error": self.error
+        }
+
+
+_JOBS: Dict[int, AnalysisJob] = {}
+
+
+def get_job(quiz_id) -> AnalysisJob:
+    return _JOBS.get(quiz_id)
+
+
+def start_job(quiz_id, run: Callable[[AnalysisJob], Awaitable]) -> AnalysisJob:
+    """Start analysis for a quiz, or attach to the job already running for it.
+
+    Attaching asks the running job for one more pass when it finishes, so
+    submissions that arrived mid-run are not left out. Jobs are claimed in
+    the database, so workers sharing it never run the same one at once;
+    returns None when another live worker holds the claim, after asking it
+    for that extra pass.
+    """
+    job = _JOBS.get(quiz_id)
+    if job is not None and job.status in ("queued", "running"):
+        job.rerun = True
+        return job
+
+    try:
+        if not database.run_in_session(lambda: _claim(quiz_id)):
+            return None
+    except ConflictError as e:
+        # Left for the next submission or page view to start.
+        print(f"Could not claim analysis of quiz {quiz_id}: {e}")
+        return None
+    job = AnalysisJob(quiz_id)
+    _JOBS[quiz_id] = job
+    job.task = asyncio.create_task(_run(job, run))
+    return job
+
+
+def get_claim(quiz_id) -> AnalysisClaim.AnalysisClaim:
+    return globals.root["analysis_claims"].get(quiz_id)
+
+
+def progress(quiz_id):
+    """The job's progress as this worker knows it, else as its owner last saved it; None when no worker has claimed it"""
+    job = _JOBS.get(quiz_id)
+    if job is not None and job.status in ("queued", "running"):
+        return job.snapshot()
+    return database.run_in_session(lambda: _claim_snapshot(quiz_id))
+
+
+def _claim_snapshot(quiz_id):
+    claim = get_claim(quiz_id)
+    if claim is None:
+        return None
+    snapshot = claim.snapshot()
+    if claim.running() and not database.worker_alive(claim.owner):
+        snapshot["status"] = "stalled"#the next start takes it over
+    return snapshot
+
+
+def _claim(quiz_id):
+    claims = globals.root["analysis_claims"]
+    claim = claims.get(quiz_id)
+    # A claim of this worker's own without a local job was left by a pass that failed to record its end.
+    if claim is not None and claim.running() and claim.owner != database.WORKER_ID and database.worker_alive(claim.owner):
+        claim.rerun = True
+        return False
+    claims[quiz_id] = AnalysisClaim.AnalysisClaim(quiz_id, database.WORKER_ID)
+    return True
+
+
+def _record_progress(job):
+    claim = get_claim(job.quiz_id)
+    if claim is not None and claim.owner == database.WORKER_ID and (claim.pairs_done, claim.pairs_total) != (job.pairs_done, job.pairs_total):
+        claim.pairs_done, claim.pairs_total = job.pairs_done, job.pairs_total
+
+
+async def _save_progress(job):
+    # Other workers report progress from the claim, so it is copied there every so often.
+    while True:
+        await asyncio.sleep(config.ANALYSIS_PROGRESS_INTERVAL)
+        try:
+            database.run_in_session(lambda: _record_progress(job))
+        except ConflictError as e:
+            print(f"Could not save the progress of quiz {job.quiz_id}'s analysis: {e}")
+
+
+def _finish(job, rerun):
+    # True when another pass was asked for, here or by another worker; otherwise the claim is closed.
+    claim = get_claim(job.quiz_id)
+    if claim is None or claim.owner != database.WORKER_ID:
+        print(f"Analysis of quiz {job.quiz_id} was taken over by another worker")
+        return False
+    claim.pairs_done, claim.pairs_total = job.pairs_done, job.pairs_total
+    if rerun or claim.rerun:
+        claim.rerun = False
+        return True
+    claim.status = "done"
+    claim.finished_at = time.time()
+    return False
+
+
+def _fail(quiz_id, error):
+    claim = get_claim(quiz_id)
+    if claim is not None and claim.owner == database.WORKER_ID:
+        claim.status = "failed"
+        claim.error = error
+        claim.finished_at = time.time()
+
+
+async def _run(job, run):
+    saver = asyncio.create_task(_save_progress(job))
+    try:
+        while True:
+            job.rerun = False
+            job.status = "running"
+            await run(job)
+            rerun = job.rerun
+            if not database.run_in_session(lambda: _finish(job, rerun)):
+                break
+        job.status = "done"
+    except Exception as e:
+        print(f"Error analysing quiz {job.quiz_id}: {e}")
+        job.status = "failed"
+        job.error = str(e)
+        try:
+            database.run_in_session(lambda: _fail(job.quiz_id, job.error))
+        except Exception as e:
+            print(f"Error releasing the analysis claim of quiz {job.quiz_id}: {e}")
+    finally:
+        saver.cancel()
+    job.finished_at = time.time()
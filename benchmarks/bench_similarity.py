@@ -0,0 +1,173 @@
+"""Benchmark suite for the AST similarity engine.
+
+Runs normalize_code_ast, tree_edit_distance, advanced_similarity and
+compare_all_submissions (exhaustive and LSH) over synthetic corpora and
+writes the results as JSON so runs can be compared.
+
+Run from the repository root:
+    python -m benchmarks.bench_similarity --sizes 50,500 --lengths short,long
+    python -m benchmarks.bench_similarity --sizes 50,500,2000 --output after.json --compare before.json
+"""
+import argparse
+import ast
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+import config
+import plagiarism
+from benchmarks.corpus import make_corpus
+
+
+def run_case(func, count, memory):
+    start = time.perf_counter()
+    extra = func()
+    wall = time.perf_counter() - start
+    peak = None
+    if memory:
+        # A second, traced pass: tracemalloc would distort the timing above.
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    result = {
+        "wall_s": round(wall, 4),
+        "items": count,
+        "items_per_s": round(count / wall, 1) if wall > 0 else None,
+        "peak_mb": round(peak, 2) if peak is not None else None,
+    }
+    if isinstance(extra, dict):
+        result.update(extra)
+    return result
+
+
+def sample_pairs(ids, limit, seed):
+    total = len(ids) * (len(ids) - 1) // 2
+    if total <= limit:
+        return list(itertools.combinations(ids, 2))
+    rng = random.Random(seed)
+    pairs = set()
+    while len(pairs) < limit:
+        a, b = rng.sample(ids, 2)
+        pairs.add((min(a, b), max(a, b)))
+    return sorted(pairs)
+
+
+def benchmark_corpus(codes, args):
+    ids = list(codes)
+    pairs = sample_pairs(ids, args.sample_pairs, args.seed)
+    trees = {sid: ast.parse(code) for sid, code in codes.items()}
+    all_pairs = len(ids) * (len(ids) - 1) // 2
+    cases = {}
+
+    cases["normalize_code_ast"] = run_case(
+        lambda: [plagiarism.normalize_code_ast(code) for code in codes.values()], len(codes), args.memory)
+    cases["tree_edit_distance"] = run_case(
+        lambda: [plagiarism.tree_edit_distance(trees[a], trees[b]) for a, b in pairs], len(pairs), args.memory)
+    cases["advanced_similarity"] = run_case(
+        lambda: [plagiarism.advanced_similarity(codes[a], codes[b]) for a, b in pairs], len(pairs), args.memory)
+
+    if all_pairs <= args.max_exhaustive_pairs:
+        def exhaustive():
+            result = plagiarism.compare_all_submissions(codes, use_lsh=False)
+            return {"flagged": result["flagged_count"]}
+        cases["compare_all_submissions"] = run_case(exhaustive, all_pairs, args.memory)
+    else:
+        cases["compare_all_submissions"] = {"skipped": f"{all_pairs} pairs > --max-exhaustive-pairs"}
+
+    def with_lsh():
+        result = plagiarism.compare_all_submissions(codes, use_lsh=True, verify_recall=args.verify_recall)
+        extra = {"flagged": result["flagged_count"], "candidates": result["lsh"]["candidates"]}
+        if "recall" in result["lsh"]:
+            extra["recall"] = result["lsh"]["recall"]
+        return extra
+    cases["compare_all_submissions_lsh"] = run_case(with_lsh, all_pairs, args.memory)
+    return cases
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(result):
+    return (result["benchmark"], result["size"], result["length"], result["clone_rate"])
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {case_key(r): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get(case_key(result))
+        if not before or not before.get("wall_s") or not result.get("wall_s"):
+            continue
+        print(f"  {result['benchmark']:<30} n={result['size']:<5} {result['length']:<5} clones={result['clone_rate']:<4}"
+              f" {before['wall_s']:>9.3f}s -> {result['wall_s']:>9.3f}s  ({before['wall_s'] / result['wall_s']:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AST similarity engine on synthetic corpora.")
+    parser.add_argument("--sizes", default="50,500", help="comma separated submission counts, e.g. 50,500,2000")
+    parser.add_argument("--lengths", default="short,long", help="comma separated program lengths: short, long")
+    parser.add_argument("--clone-rates", default="0.2", help="comma separated fractions of copied submissions")
+    parser.add_argument("--sample-pairs", type=int, default=300, help="pairs used for the per-pair benchmarks")
+    parser.add_argument("--max-exhaustive-pairs", type=int, default=150000, help="skip exhaustive comparison above this")
+    parser.add_argument("--workers", type=int, default=None, help="override PLAGIARISM_WORKERS")
+    parser.add_argument("--verify-recall", action="store_true", help="also measure LSH recall (runs exhaustive scoring)")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the traced peak-memory pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    args = parser.parse_args()
+
+    if args.workers is not None:
+        config.PLAGIARISM_WORKERS = args.workers
+
+    results = []
+    for size, length, clone_rate in itertools.product(
+            [int(x) for x in args.sizes.split(",")],
+            args.lengths.split(","),
+            [float(x) for x in args.clone_rates.split(",")]):
+        codes = make_corpus(size, length, clone_rate, args.seed)
+        for benchmark, case in benchmark_corpus(codes, args).items():
+            result = {"benchmark": benchmark, "size": size, "length": length, "clone_rate": clone_rate}
+            result.update(case)
+            results.append(result)
+            if "skipped" in case:
+                print(f"{benchmark:<30} n={size:<5} {length:<5} clones={clone_rate:<4} skipped: {case['skipped']}")
+            else:
+                peak = f"{case['peak_mb']:8.2f} MB" if case["peak_mb"] is not None else ""
+                print(f"{benchmark:<30} n={size:<5} {length:<5} clones={clone_rate:<4}"
+                      f" {case['wall_s']:>9.3f}s {case['items_per_s']:>12.1f}/s {peak}")
+
+    plagiarism.shutdown_pool()
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "workers": config.PLAGIARISM_WORKERS,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
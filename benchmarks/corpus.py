@@ -0,0 +1,57 @@
+"""Synthetic Python submission corpora for the similarity benchmarks."""
+import random
+from typing import Dict
+
+STATEMENTS = [
+    "{v} = {w} + {n}",
+    "{v} = [{w} * i for i in range({n})]",
+    "if {v} > {n}:\n    {w} = {v} - 1",
+    "for i in range({n}):\n    {v} += i",
+    "while {v} < {n}:\n    {v} = {v} * 2",
+    "print({v}, {w})",
+    "{v} = {{'k': {w}, 'n': {n}}}",
+    "def helper_{n}({v}):\n    return {v} % {n}",
+    "try:\n    {v} = {w} // {n}\nexcept ZeroDivisionError:\n    {v} = 0",
+]
+
+NAMES = ["a", "b", "total", "count", "x", "y", "result"]
+
+LENGTHS = {"short": 15, "long": 150}
+
+
+def synthetic_program(rng, lines):
+    body = [f"{name} = 0" for name in NAMES]
+    while len(body) < lines:
+        template = rng.choice(STATEMENTS)
+        body.append(template.format(v=rng.choice(NAMES), w=rng.choice(NAMES), n=rng.randint(1, 99)))
+    return "\n".join(body)
+
+
+def disguise(rng, code):
+    # What a copying student does: rename variables, add and drop a few lines.
+    renames = {name: f"{name}_{rng.randint(0, 9)}" for name in NAMES if rng.random() < 0.5}
+    lines = code.split("\n")
+    for _ in range(max(1, len(lines) // 20)):
+        if rng.random() < 0.5 and len(lines) > 1:
+            index = rng.randrange(1, len(lines))
+            if not lines[index].startswith(" ") and (index + 1 == len(lines) or not lines[index + 1].startswith(" ")):
+                del lines[index]
+        else:
+            lines.append(f"print({rng.choice(NAMES)})")
+    code = "\n".join(lines)
+    for old, new in renames.items():
+        code = code.replace(f"{old} ", f"{new} ").replace(f"({old}", f"({new}").replace(f"{old})", f"{new})")
+    return code
+
+
+def make_corpus(size: int, length: str = "short", clone_rate: float = 0.2, seed: int = 0) -> Dict[int, str]:
+    """size submissions keyed by student id; clone_rate of them copy another."""
+    rng = random.Random(seed)
+    lines = LENGTHS[length]
+    submissions = {}
+    for sid in range(1, size + 1):
+        if submissions and rng.random() < clone_rate:
+            submissions[sid] = disguise(rng, submissions[rng.randrange(1, sid)])
+        else:
+            submissions[sid] = synthetic_program(rng, rng.randint(lines // 2, lines * 3 // 2))
+    return submissions
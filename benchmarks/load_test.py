@@ -0,0 +1,137 @@
+"""End-to-end load test against a running CodeHive server.
+
+Each virtual user logs in, lists quizzes, submits an answer, asks the tutor
+a question over the streaming chat route and opens the professor's analysis
+page. Reports p50/p95/p99 latency per route. Point the server at the mock
+provider first so no paid calls are made:
+
+    python -m benchmarks.mock_llm &
+    CODEHIVE_AI_PROVIDER=mock uvicorn main:app &
+    python -m benchmarks.load_test --users 50 --iterations 3
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.corpus import synthetic_program
+from data import Professors, Students
+
+QUESTIONS = [
+    "What is a loop?",
+    "Explain recursion",
+    "Give me practice problems on arrays",
+    "Summary notes for sorting",
+    "What is a linked list?",
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, client, route, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            if kwargs.pop("stream", False):
+                async with client.stream(method, url, **kwargs) as response:
+                    async for _ in response.aiter_bytes():
+                        pass
+            else:
+                response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[route] += 1
+            print(f"{route}: {e!r}")
+            return None
+        self.timings[route].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+    def report(self):
+        rows = {}
+        for route, samples in self.timings.items():
+            samples = sorted(samples)
+            cuts = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+            rows[route] = {
+                "requests": len(samples),
+                "errors": self.errors[route],
+                "p50_ms": round(cuts[49] * 1000, 1),
+                "p95_ms": round(cuts[94] * 1000, 1),
+                "p99_ms": round(cuts[98] * 1000, 1),
+                "max_ms": round(samples[-1] * 1000, 1),
+            }
+        return rows
+
+
+async def create_quiz(client, professor_id, course_id):
+    await client.post(f"/professor/{professor_id}/quiz/new", data={
+        "title": "Load test", "course": course_id, "question": "Print the sum of a list of numbers",
+        "sample_output": "15", "duedate": "2099-01-01", "duration": 60, "total_s": 10,
+    })
+    page = await client.get(f"/professor/{professor_id}/quizzes")
+    return max(int(qid) for qid in re.findall(rf"/professor/{professor_id}/quiz/(\d+)/", page.text))
+
+
+async def virtual_user(client, recorder, student_id, professor_id, course_id, quiz_id, iterations, seed):
+    rng = random.Random(seed)
+    chat_id = int(f"{student_id}{course_id}")
+    for _ in range(iterations):
+        await recorder.request(client, "login", "POST", "/login", data={"user_id": student_id})
+        await recorder.request(client, "quiz list", "GET", f"/student/{student_id}/quizzes")
+        await recorder.request(client, "submit", "POST", f"/student/{student_id}/quiz/{quiz_id}/submit",
+                               data={"student_code": synthetic_program(rng, 30)})
+        await recorder.request(client, "chat page", "GET", f"/student/{student_id}/chat/{chat_id}")
+        await recorder.request(client, "chat", "POST", f"/student/{student_id}/chat/{chat_id}/stream",
+                               data={"question": rng.choice(QUESTIONS)}, stream=True)
+        await recorder.request(client, "analysis", "GET", f"/professor/{professor_id}/quiz/{quiz_id}/analysis")
+
+
+async def run(args):
+    professor_id, _, course_ids = Professors[0]
+    course_id = course_ids[0]
+    students = [s[0] for s in Students[:args.users]]
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        quiz_id = args.quiz or await create_quiz(client, professor_id, course_id)
+        recorder = Recorder()
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            virtual_user(client, recorder, sid, professor_id, course_id, quiz_id, args.iterations, args.seed + i)
+            for i, sid in enumerate(students)
+        ])
+        elapsed = time.perf_counter() - start
+    return {"users": len(students), "iterations": args.iterations, "quiz_id": quiz_id,
+            "elapsed_s": round(elapsed, 2), "routes": recorder.report()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=1, help="scenario runs per user")
+    parser.add_argument("--quiz", type=int, default=None, help="quiz to submit to (default: create one)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{results['users']} users x {results['iterations']} iterations in {results['elapsed_s']}s")
+    print(f"{'route':<12}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route, row in results["routes"].items():
+        print(f"{route:<12}{row['requests']:>10}{row['errors']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
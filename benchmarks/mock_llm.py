@@ -0,0 +1,105 @@
+"""Local stand-in for the chat completions API, for load tests without paid calls.
+
+Answers in the formats the AI classes parse: "(score, mistakes, comments)" for
+CodeEvaluator, "[True, ...]" for QuestionChecker and plain text for the tutor,
+streamed when asked to. Latency and error rate are configurable.
+
+Run from the repository root, then start the app against it:
+    python -m benchmarks.mock_llm --latency 0.8 --jitter 0.4 --error-rate 0.02
+    CODEHIVE_AI_PROVIDER=mock uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+settings = argparse.Namespace(latency=0.5, jitter=0.2, error_rate=0.0, token_delay=0.02)
+
+TUTOR_ANSWER = (
+    "A loop repeats a block of code while a condition holds. "
+    "For example, a for loop can add up the numbers in a list one at a time. "
+    "Loops matter in this course because most algorithms visit their input step by step."
+)
+
+
+def reply_for(messages):
+    prompt = "\n".join(message.get("content") or "" for message in messages)
+    if "(score, mistakes, comments)" in prompt:
+        total = re.search(r"Total Score:\s*(\d+)", prompt)
+        total = int(total.group(1)) if total else 10
+        return f'({random.randint(0, total)}, "None", "None")'
+    if "[True, suggestions]" in prompt:
+        return "[True, The question is clear and matches the sample output.]"
+    return TUTOR_ANSWER
+
+
+def completion(content, model):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()), "total_tokens": len(content.split())},
+    }
+
+
+def chunk(completion_id, model, delta, finish_reason=None):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "mock")
+    await asyncio.sleep(max(0.0, random.gauss(settings.latency, settings.jitter)))
+    if random.random() < settings.error_rate:
+        status = random.choice([429, 500, 503])
+        return JSONResponse({"error": {"message": "mock upstream error", "code": status}}, status_code=status)
+
+    content = reply_for(body.get("messages", []))
+    if not body.get("stream"):
+        return completion(content, model)
+
+    async def events():
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        yield f"data: {json.dumps(chunk(completion_id, model, {'role': 'assistant', 'content': ''}))}\n\n"
+        for word in re.findall(r"\S+\s*", content):
+            await asyncio.sleep(settings.token_delay)
+            yield f"data: {json.dumps(chunk(completion_id, model, {'content': word}))}\n\n"
+        yield f"data: {json.dumps(chunk(completion_id, model, {}, 'stop'))}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=settings.latency, help="mean seconds before answering")
+    parser.add_argument("--jitter", type=float, default=settings.jitter, help="standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=settings.error_rate, help="fraction of requests answered with 429/500/503")
+    parser.add_argument("--token-delay", type=float, default=settings.token_delay, help="seconds between streamed words")
+    args = parser.parse_args()
+    for name in ("latency", "jitter", "error_rate", "token_delay"):
+        setattr(settings, name, getattr(args, name))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import os
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+#Plagiarism analysis
+PLAGIARISM_FLAG_THRESHOLD = _env_float("CODEHIVE_FLAG_THRESHOLD", 75)
+# Pairs that cannot score above this stop their tree edit distance early and are stored as
+# below threshold, like LSH-skipped pairs: never flagged and left out of average similarity.
+# 0 scores every pair in full, which keeps the per-student averages exact.
+SIMILARITY_THRESHOLD = _env_float("CODEHIVE_SIMILARITY_THRESHOLD", 0)
+# Quizzes with at least this many submissions only score LSH candidate pairs exactly.
+LSH_MIN_SUBMISSIONS = _env_int("CODEHIVE_LSH_MIN_SUBMISSIONS", 100)
+# More bands (or fewer rows per band) = higher recall, more exact comparisons.
+# bench_similarity --verify-recall with 128x3 and 5-token shingles: 200 short programs keep
+# all 261 flagged pairs and skip 48% of pairs, 500 short keep 99.7% of 1857 and skip 50%,
+# 200 long keep all 29 and skip 41%. Real quizzes can do worse (32 of 33 has been seen),
+# so only LSH_VERIFY_RECALL guarantees no flagged pair is missed.
+LSH_BANDS = _env_int("CODEHIVE_LSH_BANDS", 128)
+LSH_ROWS = _env_int("CODEHIVE_LSH_ROWS", 3)
+LSH_SHINGLE_SIZE = _env_int("CODEHIVE_LSH_SHINGLE_SIZE", 5)
+# Also score the pairs LSH skips, so none is missed, and report how many flagged pairs it would have missed.
+LSH_VERIFY_RECALL = _env_bool("CODEHIVE_LSH_VERIFY_RECALL", False)
+# Worker processes for pairwise scoring; 1 keeps everything in-process.
+PLAGIARISM_WORKERS = _env_int("CODEHIVE_PLAGIARISM_WORKERS", os.cpu_count() or 1)
+# Below this many pairs the work is scored in one chunk without the process pool.
+PLAGIARISM_PARALLEL_MIN_PAIRS = _env_int("CODEHIVE_PLAGIARISM_PARALLEL_MIN_PAIRS", 2000)
+# Students per block; each worker task scores up to TILE_SIZE**2 pairs.
+PLAGIARISM_TILE_SIZE = _env_int("CODEHIVE_PLAGIARISM_TILE_SIZE", 64)
+
+#Winnowing index for cross-quiz search
+WINNOW_K = _env_int("CODEHIVE_WINNOW_K", 8)
+WINNOW_WINDOW = _env_int("CODEHIVE_WINNOW_WINDOW", 4)
+# Hashes found at more positions than this are treated as boilerplate and ignored.
+WINNOW_MAX_POSTINGS = _env_int("CODEHIVE_WINNOW_MAX_POSTINGS", 200)
+
+#Background analysis jobs
+# How long the analysis page waits for a job before showing live progress instead.
+ANALYSIS_INLINE_WAIT = _env_float("CODEHIVE_ANALYSIS_INLINE_WAIT", 2)
+# Seconds between saves of a running job's progress, which is what other workers report.
+ANALYSIS_PROGRESS_INTERVAL = _env_float("CODEHIVE_ANALYSIS_PROGRESS_INTERVAL", 2)
+
+#AI provider
+# Where the AI classes send requests; "mock" is the local stand-in in benchmarks/mock_llm.py.
+AI_PROVIDERS = {
+    "openrouter": "https://openrouter.ai/api/v1",
+    "mock": "http://127.0.0.1:8900/v1",
+}
+AI_PROVIDER = os.environ.get("CODEHIVE_AI_PROVIDER", "openrouter")
+AI_BASE_URL = os.environ.get("CODEHIVE_AI_BASE_URL") or AI_PROVIDERS[AI_PROVIDER]
+AI_API_KEY = os.environ.get("CODEHIVE_AI_API_KEY", "your-openai-api-key")
+AI_MODEL = os.environ.get("CODEHIVE_AI_MODEL", "google/gemini-2.5-flash-lite")
+# Seconds before a request to the model is abandoned; connecting gets its own, shorter limit.
+AI_TIMEOUT = _env_float("CODEHIVE_AI_TIMEOUT", 60)
+AI_CONNECT_TIMEOUT = _env_float("CODEHIVE_AI_CONNECT_TIMEOUT", 10)
+AI_MAX_CONNECTIONS = _env_int("CODEHIVE_AI_MAX_CONNECTIONS", 100)
+AI_MAX_KEEPALIVE_CONNECTIONS = _env_int("CODEHIVE_AI_MAX_KEEPALIVE_CONNECTIONS", 20)
+AI_MAX_RETRIES = _env_int("CODEHIVE_AI_MAX_RETRIES", 2)
+# Requests per second allowed by the provider quota, and how many may go out at once after a quiet spell.
+AI_RATE_LIMIT = _env_float("CODEHIVE_AI_RATE_LIMIT", 10)
+AI_RATE_BURST = _env_int("CODEHIVE_AI_RATE_BURST", 20)
+# Seconds each kind of call may take, retries included, before it counts as a provider failure.
+AI_GRADING_DEADLINE = _env_float("CODEHIVE_AI_GRADING_DEADLINE", 45)
+AI_TUTOR_DEADLINE = _env_float("CODEHIVE_AI_TUTOR_DEADLINE", 60)
+AI_CHECK_DEADLINE = _env_float("CODEHIVE_AI_CHECK_DEADLINE", 20)
+# After this many provider failures in a row, calls fail fast for AI_BREAKER_RESET seconds.
+AI_BREAKER_FAILURES = _env_int("CODEHIVE_AI_BREAKER_FAILURES", 5)
+AI_BREAKER_RESET = _env_float("CODEHIVE_AI_BREAKER_RESET", 30)
+# Student code beyond this many (estimated) tokens is cut to its beginning and end before grading.
+AI_SUBMISSION_TOKEN_BUDGET = _env_int("CODEHIVE_AI_SUBMISSION_TOKEN_BUDGET", 3000)
+# Per-call token counts kept in memory for the usage report.
+AI_USAGE_HISTORY = _env_int("CODEHIVE_AI_USAGE_HISTORY", 500)
+
+#Grading queue
+# Submissions graded at the same time; the rest wait in the queue.
+GRADING_WORKERS = _env_int("CODEHIVE_GRADING_WORKERS", 8)
+GRADING_MAX_ATTEMPTS = _env_int("CODEHIVE_GRADING_MAX_ATTEMPTS", 4)
+# Seconds before the first retry, doubled after each failed attempt.
+GRADING_RETRY_DELAY = _env_float("CODEHIVE_GRADING_RETRY_DELAY", 2)
+# Responses whose retries all failed are tried again this many seconds later instead of scoring 0.
+GRADING_DEFER_DELAY = _env_float("CODEHIVE_GRADING_DEFER_DELAY", 60)
+# Replies the model keeps getting wrong are deferred this many times before grading is marked failed.
+GRADING_MAX_DEFERRALS = _env_int("CODEHIVE_GRADING_MAX_DEFERRALS", 5)
+# Graded answers remembered, so identical resubmissions skip the model.
+GRADE_CACHE_SIZE = _env_int("CODEHIVE_GRADE_CACHE_SIZE", 10000)
+
+#Question validation
+# Seconds a validation verdict is reused, so creating the quiz right after validating it skips the model.
+QUESTION_CHECK_TTL = _env_float("CODEHIVE_QUESTION_CHECK_TTL", 600)
+QUESTION_CHECK_CACHE_SIZE = _env_int("CODEHIVE_QUESTION_CHECK_CACHE_SIZE", 1000)
+
+#AI tutor
+# Seconds a tutor answer is reused for the same question in the same course.
+CHAT_CACHE_TTL = _env_float("CODEHIVE_CHAT_CACHE_TTL", 3600)
+# Answers kept per course; the least recently asked are dropped first.
+CHAT_CACHE_SIZE = _env_int("CODEHIVE_CHAT_CACHE_SIZE", 200)
+
+#Sandboxed pre-grading
+# Run submissions locally first so syntax errors and timeouts skip the model.
+# Needs bubblewrap (bwrap) and prlimit; without them submissions go straight to the model.
+SANDBOX_ENABLED = _env_bool("CODEHIVE_SANDBOX_ENABLED", False)
+SANDBOX_BWRAP = os.environ.get("CODEHIVE_SANDBOX_BWRAP", "bwrap")
+SANDBOX_WORKERS = _env_int("CODEHIVE_SANDBOX_WORKERS", os.cpu_count() or 1)
+# Seconds of wall time per run; CPU time is capped just above it.
+SANDBOX_TIMEOUT = _env_float("CODEHIVE_SANDBOX_TIMEOUT", 5)
+SANDBOX_MEMORY_MB = _env_int("CODEHIVE_SANDBOX_MEMORY_MB", 256)
+SANDBOX_MAX_OUTPUT_KB = _env_int("CODEHIVE_SANDBOX_MAX_OUTPUT_KB", 64)
+# Processes and threads a run may have at once; node needs a handful of threads of its own.
+SANDBOX_MAX_PROCESSES = _env_int("CODEHIVE_SANDBOX_MAX_PROCESSES", 32)
+
+#Discussions
+# Discussions shown per page of a batch's feed; "Load more" fetches the next page.
+DISCUSSION_PAGE_SIZE = _env_int("CODEHIVE_DISCUSSION_PAGE_SIZE", 20)
+
+#Database
+# Ids each process reserves at once for new quizzes, responses and discussions; unused ones are skipped after a restart.
+ID_BLOCK_SIZE = _env_int("CODEHIVE_ID_BLOCK_SIZE", 20)
+# Connections kept open for requests and background jobs; each holds its own object cache.
+DB_POOL_SIZE = _env_int("CODEHIVE_DB_POOL_SIZE", 32)
+# Times a request is replayed after its commit lost a write conflict to another request.
+DB_CONFLICT_RETRIES = _env_int("CODEHIVE_DB_CONFLICT_RETRIES", 5)
+# Upper bound in seconds of the random pause before the first replay, doubled for each one after.
+DB_CONFLICT_BACKOFF = _env_float("CODEHIVE_DB_CONFLICT_BACKOFF", 0.05)
+# Objects each pooled connection keeps in memory between requests.
+DB_CACHE_SIZE = _env_int("CODEHIVE_DB_CACHE_SIZE", 5000)
+
+#ZEO, for several workers or nodes sharing one database
+# host:port or unix socket path of the ZEO server; empty keeps the local FileStorage file.
+ZEO_ADDRESS = os.environ.get("CODEHIVE_ZEO_ADDRESS", "")
+# Persistent client caches, one file per worker process, kept across restarts.
+ZEO_CACHE_DIR = os.environ.get("CODEHIVE_ZEO_CACHE_DIR", "zeo-cache")
+ZEO_CACHE_MB = _env_int("CODEHIVE_ZEO_CACHE_MB", 200)
+ZEO_CACHE_SLOTS = _env_int("CODEHIVE_ZEO_CACHE_SLOTS", 64)
+# Fetch pending invalidations before each transaction, so a worker sees what other workers just committed.
+ZEO_SERVER_SYNC = _env_bool("CODEHIVE_ZEO_SERVER_SYNC", True)
+# Seconds to wait for the ZEO server at startup.
+ZEO_WAIT_TIMEOUT = _env_float("CODEHIVE_ZEO_WAIT_TIMEOUT", 30)
+# Each worker renews a heartbeat this often. Grading, analysis jobs and seeding held by a worker silent
+# for WORKER_LEASE seconds are taken over; workers look for such grading once per lease.
+WORKER_HEARTBEAT_INTERVAL = _env_float("CODEHIVE_WORKER_HEARTBEAT_INTERVAL", 5)
+WORKER_LEASE = _env_float("CODEHIVE_WORKER_LEASE", 30)
@@ -0,0 +1,397 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+import ZODB, ZODB.FileStorage
+from ZODB.POSException import ConflictError
+import BTrees._OOBTree
+from BTrees.OOBTree import OOBTree, OOTreeSet
+import transaction
+import config
+import globals
+from models import WinnowIndex, GradeCache, QuizIndex, DiscussionIndex, IdCounter
+
+ID_COLLECTIONS = ['quizzes', 'responses', 'discussions']
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"#unique even when a restarted container reuses its host name and pid
+_heartbeat = None
+
+_id_blocks = {}#collection -> [next id, end of the reserved block)
+_id_lock = threading.Lock()
+
+_cache_slot_lock = None#held for the life of the process so no other worker opens the same ZEO cache file
+
+_session = contextvars.ContextVar("codehive_db_session", default=None)
+
+
+def open_db(path='mydata.fs'):
+    """Open the ZEO server named by CODEHIVE_ZEO_ADDRESS, or else the FileStorage at path"""
+    client = _claim_cache_slot() if config.ZEO_ADDRESS else None
+    for attempt in range(config.DB_CONFLICT_RETRIES + 1):
+        storage = open_zeo_storage(client) if config.ZEO_ADDRESS else ZODB.FileStorage.FileStorage(path)
+        try:
+            globals.db = ZODB.DB(storage, pool_size=config.DB_POOL_SIZE, cache_size=config.DB_CACHE_SIZE)
+            break
+        except ConflictError:
+            # Another worker created the root object of a new database at the same moment.
+            storage.close()
+            if attempt == config.DB_CONFLICT_RETRIES:
+                raise
+    globals.root = _CurrentRoot()
+    _id_blocks.clear()
+    # Several workers may start against a new database at once; it is one transaction, so the losers retry and find it done.
+    run_in_session(_create_roots)
+    globals.connection = globals.db.open()#shared by startup, scripts and anything else outside a session
+
+
+def open_zeo_storage(client):
+    import ZEO#only needed when running against a ZEO server
+    address = config.ZEO_ADDRESS
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        address = (host, int(port))
+    return ZEO.client(
+        address,
+        cache_size=config.ZEO_CACHE_MB * 1024 * 1024,
+        client=client,
+        var=config.ZEO_CACHE_DIR if client else None,
+        server_sync=config.ZEO_SERVER_SYNC,
+        wait_timeout=config.ZEO_WAIT_TIMEOUT,
+    )
+
+
+def _claim_cache_slot():
+    # A cache file can only be used by one process; taking the first free slot lets a restarted worker reuse a warm one.
+    global _cache_slot_lock
+    import zc.lockfile
+    os.makedirs(config.ZEO_CACHE_DIR, exist_ok=True)
+    for slot in range(config.ZEO_CACHE_SLOTS):
+        try:
+            _cache_slot_lock = zc.lockfile.LockFile(os.path.join(config.ZEO_CACHE_DIR, f"codehive-{slot}.slot"))
+        except zc.lockfile.LockError:
+            continue
+        return f"codehive-{slot}"
+    print(f"All {config.ZEO_CACHE_SLOTS} ZEO cache slots are taken; this process uses a temporary cache")
+    return None
+
+
+async def claim_startup():
+    """Wait until no other live worker is seeding the database, then mark this one as doing it"""
+    if not config.ZEO_ADDRESS:
+        return#FileStorage is locked to a single process
+
+    def claim():
+        seeding = globals.root.get("startup_claimed_by")
+        if seeding is not None and seeding != WORKER_ID and worker_alive(seeding):
+            return False
+        globals.root["startup_claimed_by"] = WORKER_ID
+        return True
+
+    while not run_in_session(claim):
+        await asyncio.sleep(0.5)
+
+
+def finish_startup():
+    if config.ZEO_ADDRESS:
+        def finish():
+            globals.root["startup_claimed_by"] = None
+        run_in_session(finish)
+
+
+def worker_alive(worker):
+    """Whether the worker that claimed some work is still running, judged by its heartbeat"""
+    if worker == WORKER_ID:
+        return True
+    if not config.ZEO_ADDRESS:
+        return False#FileStorage is locked to a single process, so any other worker has exited
+    return time.time() - globals.root["worker_heartbeats"].get(worker, 0) < config.WORKER_LEASE
+
+
+def _beat():
+    heartbeats = globals.root["worker_heartbeats"]
+    now = time.time()
+    heartbeats[WORKER_ID] = now
+    for worker, seen in list(heartbeats.items()):
+        if now - seen > config.WORKER_LEASE * 100:#long gone without a clean shutdown
+            del heartbeats[worker]
+
+
+async def _keep_alive():
+    while True:
+        await asyncio.sleep(config.WORKER_HEARTBEAT_INTERVAL)
+        try:
+            run_in_session(_beat)
+        except ConflictError as e:
+            print(f"Could not renew the heartbeat of worker {WORKER_ID}: {e}")
+
+
+def start_heartbeat():
+    """Announce this worker as alive, and keep doing so, before it claims any shared work"""
+    global _heartbeat
+    if config.ZEO_ADDRESS:
+        run_in_session(_beat)
+        _heartbeat = asyncio.create_task(_keep_alive())
+
+
+async def stop_heartbeat():
+    global _heartbeat
+    if _heartbeat is not None:
+        _heartbeat.cancel()
+        await asyncio.gather(_heartbeat, return_exceptions=True)
+        _heartbeat = None
+        # Lets other workers take over this worker's claims without waiting out the lease.
+        run_in_session(lambda: globals.root["worker_heartbeats"].pop(WORKER_ID, None))
+
+
+def _create_roots():
+    class_names = ['professors', 'courses', 'students', 'quizzes', 'discussions', 'chat_histories', 'responses', 'similarity_matrices']
+    for c in class_names:
+        if c not in globals.root:
+            globals.root[c] = BTrees._OOBTree.BTree()
+
+    if "winnow_index" not in globals.root:
+        globals.root["winnow_index"] = WinnowIndex.WinnowIndex()
+
+    if "grading_queue" not in globals.root:
+        globals.root["grading_queue"] = OOTreeSet()#ids of responses still waiting to be graded
+
+    if "grade_cache" not in globals.root:
+        globals.root["grade_cache"] = GradeCache.GradeCache()
+
+    if "worker_heartbeats" not in globals.root:
+        globals.root["worker_heartbeats"] = OOBTree()#worker id -> time of its last heartbeat
+
+    if "analysis_claims" not in globals.root:
+        globals.root["analysis_claims"] = OOBTree()#quiz id -> AnalysisClaim of the worker analysing it
+
+
+    if "quiz_index" not in globals.root:
+        index = QuizIndex.QuizIndex()
+        index.rebuild(globals.root["quizzes"])#backfill quizzes created before the index existed
+        globals.root["quiz_index"] = index
+
+    if "discussion_index" not in globals.root:
+        index = DiscussionIndex.DiscussionIndex()
+        index.rebuild(globals.root["discussions"])
+        globals.root["discussion_index"] = index
+
+    if "participants_converted" not in globals.root:
+        for qid in globals.root["quizzes"]:
+            globals.root["quizzes"][qid].convert_participants()
+        globals.root["participants_converted"] = True
+
+    if "id_counters" not in globals.root:
+        globals.root["id_counters"] = BTrees._OOBTree.BTree()
+    for c in ID_COLLECTIONS:
+        if c not in globals.root["id_counters"]:
+            collection = globals.root[c]
+            globals.root["id_counters"][c] = IdCounter.IdCounter(collection.maxKey() if collection else 0)
+
+
+class _CurrentRoot:
+    """What globals.root refers to: the root of the current session's connection, or of the shared one outside sessions"""
+
+    def _root(self):
+        current = _session.get()
+        return (current.connection if current else globals.connection).root()
+
+    def __getitem__(self, key):
+        return self._root()[key]
+
+    def __setitem__(self, key, value):
+        self._root()[key] = value
+
+    def __delitem__(self, key):
+        del self._root()[key]
+
+    def __contains__(self, key):
+        return key in self._root()
+
+    def __iter__(self):
+        return iter(self._root())
+
+    def __len__(self):
+        return len(self._root())
+
+    def __getattr__(self, name):
+        return getattr(self._root(), name)
+
+
+class Session:
+    """A pooled connection with a transaction manager of its own, opened on first use"""
+
+    def __init__(self):
+        self.manager = transaction.TransactionManager()
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = globals.db.open(transaction_manager=self.manager)
+        return self._connection
+
+    def commit(self):
+        if self._connection is not None:
+            self.manager.commit()
+
+    def abort(self):
+        if self._connection is not None:
+            self.manager.abort()
+
+    def close(self):
+        if self._connection is not None:
+            self.manager.abort()
+            self._connection.close()
+            self._connection = None
+
+
+@contextlib.contextmanager
+def session():
+    """Run the enclosed code on its own connection and MVCC snapshot; commits on success, aborts on error"""
+    current = Session()
+    token = _session.set(current)
+    try:
+        yield current
+        current.commit()
+    finally:
+        _session.reset(token)
+        current.close()
+
+
+def run_in_session(work):
+    """Call work() in a session of its own, again on a fresh snapshot after each write conflict"""
+    for attempt in range(config.DB_CONFLICT_RETRIES + 1):
+        try:
+            with session():
+                return work()
+        except ConflictError:
+            if attempt == config.DB_CONFLICT_RETRIES:
+                raise
+
+
+async def run_in_session_async(work):
+    """run_in_session for a coroutine function"""
+    for attempt in range(config.DB_CONFLICT_RETRIES + 1):
+        try:
+            with session():
+                return await work()
+        except ConflictError:
+            if attempt == config.DB_CONFLICT_RETRIES:
+                raise
+
+
+def commit():
+    """Commit the current session, or the shared connection's transaction outside sessions"""
+    current = _session.get()
+    if current is None:
+        transaction.commit()
+    else:
+        current.commit()
+
+
+def abort():
+    current = _session.get()
+    if current is None:
+        transaction.abort()
+    else:
+        current.abort()
+
+
+class SessionMiddleware:
+    """Runs every HTTP request in a session of its own.
+
+    The session is committed just before the response starts, so a write
+    conflict can still be answered by replaying the request on a fresh
+    snapshot; the body is buffered for that.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        for attempt in range(config.DB_CONFLICT_RETRIES + 1):
+            started = False
+            replayed = False
+
+            async def replay():
+                nonlocal replayed
+                if replayed:
+                    return await receive()
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            try:
+                with session() as current:
+                    async def send_after_commit(message):
+                        nonlocal started
+                        if message["type"] == "http.response.start":
+                            current.commit()
+                            started = True
+                        await send(message)
+
+                    await self.app(scope, replay, send_after_commit)
+                return
+            except ConflictError:
+                if started or attempt == config.DB_CONFLICT_RETRIES:
+                    raise
+                print(f"Write conflict on {scope['path']}, retrying (attempt {attempt + 1})")
+                # Jittered, so requests that collided once do not collide again on the replay.
+                await asyncio.sleep(random.uniform(0, config.DB_CONFLICT_BACKOFF) * 2 ** attempt)
+
+
+def next_id(collection):
+    """A new id for collection, unique across every process sharing the database"""
+    with _id_lock:
+        block = _id_blocks.get(collection)
+        if block is None or block[0] >= block[1]:
+            block = _id_blocks[collection] = _reserve_ids(collection, config.ID_BLOCK_SIZE)
+        new_id = block[0]
+        block[0] += 1
+        return new_id
+
+
+def _reserve_ids(collection, size):
+    # Reserved in a connection of its own, so the block is committed whatever happens to the caller's transaction.
+    manager = transaction.TransactionManager()
+    connection = globals.db.open(transaction_manager=manager)
+    try:
+        for attempt in range(5):
+            try:
+                counter = connection.root()["id_counters"][collection]
+                start = counter.value + 1
+                counter.value += size
+                manager.commit()
+                return [start, start + size]
+            except ConflictError:
+                manager.abort()
+        raise ConflictError(f"could not reserve ids for {collection}")
+    finally:
+        connection.close()
+
+
+def close_db():
+    global _cache_slot_lock
+    transaction.commit()
+    if globals.connection:
+        globals.connection.close()
+    globals.db.close()
+    if _cache_slot_lock is not None:
+        _cache_slot_lock.close()
+        _cache_slot_lock = None
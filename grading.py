@@ -0,0 +1,203 @@
+"""Grading a Response and crediting the result to the student's skills.
+
+Nothing here commits; callers decide how often to commit.
+"""
+import config
+import database
+import globals
+import sandbox
+from ai_guard import get_guard, is_upstream_failure
+from models.GradeCache import cache_key
+
+
+def award_skills(student, course_id, points):
+    mathematical=[1006710,1006717,1006718,1006716,1006730,96642170,96642022]
+    programming=[1286121,1286120,1286131,1286222,1286228,1286232,1286391,1286233]
+    computer=[1286111,1286213,1286112]
+    networking=[1286241,1286223]
+    if(points!=0):
+        if course_id in mathematical:
+            student.skills["Mathematical & Analytical Skills"]+=points
+            student._p_changed=True
+
+        if course_id in programming:
+            student.skills["Programming & Software Development Skills"]+=points
+            student._p_changed=True
+
+        if course_id in computer:
+            student.skills["Computer Systems & Hardware Skills"]+=points
+            student._p_changed=True
+
+        if course_id in networking:
+            student.skills["Data & Networking Skills"]+=points
+            student._p_changed=True
+
+
+def awarded_points(response):
+    # Responses graded before this was tracked were credited their score when positive.
+    if response.awarded_points is None:
+        return max(response.score, 0) if isinstance(response.score, int) else 0
+    return response.awarded_points
+
+
+def finish_grading(response, calculated_result, status):
+    """Store the result and credit the student only the change from what this response gave before"""
+    points = max(calculated_result[0], 0)
+    student = globals.root["students"][response.student_id]
+    award_skills(student, response.quiz.course_id, points - awarded_points(response))
+    response.awarded_points = points
+    response.score, response.mistakes, response.comments = calculated_result
+    response.grading_status = status
+    response.regrading = False
+    response.deferrals = 0
+    response.grading_owner = None
+    if response.id in globals.root["grading_queue"]:
+        globals.root["grading_queue"].remove(response.id)
+
+
+async def evaluate_response(evaluator, rid):
+    """Grade a pending response from the grade cache, the sandbox or the model, without writing anything.
+
+    Returns (cache key, result, source) for record_grade, or None when the response is not pending.
+    """
+    response = globals.root["responses"][rid]
+    if response.grading_status != "pending":
+        return None
+    quiz = response.quiz
+    key = cache_key(quiz, response.answer)
+    calculated_result = globals.root["grade_cache"].peek(key)
+    if calculated_result is not None:
+        return key, calculated_result, "cache"
+    run_note = None
+    if config.SANDBOX_ENABLED:
+        calculated_result, run_note = await pre_grade(quiz, response.answer)
+        if calculated_result is not None:
+            return key, calculated_result, "sandbox"
+    calculated_result = await evaluator.grade(
+        quiz.question, quiz.sample_sol, response.answer,
+        quiz.languages, quiz.restriction, quiz.total_s, run_note=run_note
+    )
+    return key, calculated_result, "model"
+
+
+def record_grade(rid, key, calculated_result, source):
+    """Store a result from evaluate_response; cheap enough to redo after a write conflict"""
+    response = globals.root["responses"][rid]
+    if response.grading_status != "pending":
+        return
+    cache = globals.root["grade_cache"]
+    cache.get(key)#counts the hit or miss and refreshes the entry's recency
+    if source == "model":
+        cache.put(key, calculated_result, response.quiz.id)
+    finish_grading(response, calculated_result, "graded")
+
+
+async def grade_response(evaluator, rid):
+    graded = await evaluate_response(evaluator, rid)
+    if graded is not None:
+        record_grade(rid, *graded)
+
+
+def give_up_grading(rid, error):
+    """Called once every retry has failed; returns seconds to wait before grading again, or None when giving up"""
+    response = globals.root["responses"][rid]
+    response.grading_error = str(error)
+    if is_upstream_failure(error):
+        # The provider being down says nothing about the answer, so it is never scored for that.
+        return max(config.GRADING_DEFER_DELAY, get_guard().breaker.retry_after())
+    response.deferrals += 1
+    if response.deferrals <= config.GRADING_MAX_DEFERRALS:
+        return config.GRADING_DEFER_DELAY
+    if response.regrading:
+        # A failed regrade keeps the result the response already had.
+        finish_grading(response, [response.score, response.mistakes, response.comments], "graded")
+    else:
+        finish_grading(response, [0,None,"Something wrong with AI response"], "failed")
+
+
+def hold_for_grading(response):
+    """Add the response to the pending set, to be graded by this worker"""
+    globals.root["grading_queue"].add(response.id)
+    response.grading_owner = database.WORKER_ID
+
+
+def _claim_if_orphaned(response):
+    owner = response.grading_owner
+    if owner is not None and database.worker_alive(owner):
+        return False
+    response.grading_owner = database.WORKER_ID
+    return True
+
+
+def claim_orphans(rids=None):
+    """Take over the pending responses, of rids or of all, whose worker has stopped; returns their ids.
+
+    Each response records the worker grading it, so however many workers
+    look at once, the write conflict leaves it to only one of them.
+    """
+    queue = globals.root["grading_queue"]
+    responses = globals.root["responses"]
+    return [rid for rid in list(queue if rids is None else rids)
+            if rid in queue and rid in responses and _claim_if_orphaned(responses[rid])]
+
+
+def mark_for_regrade(quiz):
+    """Mark every submission of the quiz for grading again; returns the ids this worker should grade.
+
+    The quiz's cached grades are dropped first, so regrading asks the model
+    again instead of replaying the results being replaced. Submissions
+    already pending stay with the worker grading them, unless it stopped.
+    """
+    globals.root["grade_cache"].invalidate_quiz(quiz.id)
+    responses = globals.root["responses"]
+    pending = []
+    for sid, rid in quiz.participated_students.items():
+        if rid not in responses:
+            continue
+        response = responses[rid]
+        if response.grading_status != "pending":
+            response.student_id = sid
+            response.regrading = response.grading_status == "graded"
+            response.grading_status = "pending"
+            response.grading_error = None
+            response.deferrals = 0
+            hold_for_grading(response)
+        elif not _claim_if_orphaned(response):
+            continue
+        pending.append(rid)
+    return pending
+
+
+def _normalize_output(text):
+    lines = [line.rstrip() for line in (text or "").strip().splitlines()]
+    return "\n".join(lines)
+
+
+async def pre_grade(quiz, code):
+    """Run a submission and settle its score only when running it decides the result.
+
+    Returns (result, note). Syntax errors and timeouts score 0 when the quiz
+    names a single language. Otherwise result is None and note, when there
+    is one, is a short account of the run for the model to weigh; matching
+    output is never enough on its own, since it can be printed directly.
+    """
+    language, strict = sandbox.runner_for(quiz.languages)
+    if language is None or not code.strip() or not sandbox.isolation_available():
+        return None, None
+    result = await sandbox.run_code(language, code)
+    if result.status == "syntax_error":
+        if strict:
+            return [0, f"Syntax error: {result.detail}", "None"], None
+        return None, f"Running it as {language} failed with a syntax error: {result.detail}"
+    if result.status == "timeout":
+        if strict:
+            return [0, f"The program {result.detail}", "None"], None
+        return None, f"Running it as {language}, the program {result.detail}"
+    if result.status == "error":
+        return None, f"Running it exited with an error: {result.detail}"
+    expected = _normalize_output(quiz.sample_sol)
+    if not expected:
+        return None, None
+    if _normalize_output(result.stdout) == expected:
+        return None, "Running it printed the expected output. Check that it computes it rather than printing it directly."
+    return None, "Running it did not print the expected output."
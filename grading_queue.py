@@ -0,0 +1,95 @@
+import asyncio
+import random
+from typing import Awaitable, Callable, Iterable, List, Optional, Set
+
+import config
+
+
+_queue: asyncio.Queue = None
+_queued: Set[int] = set()
+_workers: List[asyncio.Task] = []
+_deferred: Set[asyncio.TimerHandle] = set()
+
+
+def start(grade: Callable[[int], Awaitable], give_up: Callable[[int, Exception], Optional[float]], pending: Iterable[int] = (), workers: int = None):
+    """Start the grading workers and queue the responses left pending by the last run.
+
+    grade(rid) raises to ask for a retry; give_up(rid, error) is called once
+    every attempt has failed, and may return a number of seconds after which
+    the response is queued again.
+    """
+    global _queue
+    _queue = asyncio.Queue()
+    _queued.clear()
+    for rid in pending:
+        enqueue(rid)
+    _workers[:] = [asyncio.create_task(_work(grade, give_up)) for _ in range(workers or config.GRADING_WORKERS)]
+
+
+def enqueue(rid):
+    if rid in _queued:
+        return
+    _queued.add(rid)
+    _queue.put_nowait(rid)
+
+
+def pending_count():
+    return len(_queued)
+
+
+def deferred_count():
+    return len(_deferred)
+
+
+def _defer(rid, delay):
+    def requeue():
+        _deferred.discard(handle)
+        enqueue(rid)
+    handle = asyncio.get_running_loop().call_later(delay, requeue)
+    _deferred.add(handle)
+
+
+async def drain():
+    await _queue.join()
+
+
+async def stop():
+    # Deferred responses stay pending in the database and are picked up on the next start.
+    for handle in _deferred:
+        handle.cancel()
+    _deferred.clear()
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def _work(grade, give_up):
+    while True:
+        rid = await _queue.get()
+        try:
+            await _grade_with_retries(rid, grade, give_up)
+        finally:
+            _queued.discard(rid)
+            _queue.task_done()
+
+
+async def _grade_with_retries(rid, grade, give_up):
+    for attempt in range(1, config.GRADING_MAX_ATTEMPTS + 1):
+        try:
+            await grade(rid)
+            return
+        except Exception as e:
+            error = e
+            print(f"Error grading response {rid} (attempt {attempt}): {e}")
+        if attempt < config.GRADING_MAX_ATTEMPTS:
+            # Exponential backoff with jitter, so a burst of failures does not retry in lockstep.
+            await asyncio.sleep(config.GRADING_RETRY_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+    try:
+        delay = give_up(rid, error)
+    except Exception as e:
+        print(f"Error recording failed grading for response {rid}: {e}")
+        return
+    if delay is not None:
+        print(f"Deferring response {rid} for {delay:g}s")
+        _defer(rid, delay)
@@ -0,0 +1,72 @@
+import random
+import zlib
+from collections import defaultdict
+from typing import Dict, Sequence, Set, Tuple
+
+_PRIME = (1 << 61) - 1
+
+
+def shingles(tokens: Sequence[str], k: int) -> Set[int]:
+    if not tokens:
+        return set()
+    if len(tokens) <= k:
+        return {zlib.crc32("\x1f".join(tokens).encode("utf-8"))}
+    return {
+        zlib.crc32("\x1f".join(tokens[i:i + k]).encode("utf-8"))
+        for i in range(len(tokens) - k + 1)
+    }
+
+
+class MinHashLSH:
+    """MinHash signatures over k-gram shingles, banded into LSH buckets.
+
+    Pairs that collide in at least one band become candidates. The chance
+    of that for Jaccard similarity s is 1 - (1 - s**rows)**bands, so more
+    bands raise recall and more rows per band cut candidates.
+    """
+
+    def __init__(self, bands=128, rows=3, shingle_size=5, seed=1):
+        self.bands = bands
+        self.rows = rows
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME))
+            for _ in range(bands * rows)
+        ]
+
+    def signature(self, tokens: Sequence[str]) -> Tuple[int, ...]:
+        hashes = shingles(tokens, self.shingle_size)
+        if not hashes:
+            return ()
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self.permutations)
+
+    def candidate_pairs(self, signatures: Dict[int, Tuple[int, ...]]) -> Set[Tuple[int, int]]:
+        order = {key: index for index, key in enumerate(signatures)}
+        candidates = set()
+        for band in range(self.bands):
+            start = band * self.rows
+            buckets = defaultdict(list)
+            for key, signature in signatures.items():
+                if signature:
+                    buckets[signature[start:start + self.rows]].append(key)
+            for members in buckets.values():
+                for i in range(len(members)):
+                    for j in range(i + 1, len(members)):
+                        pair = (members[i], members[j])
+                        candidates.add(pair if order[pair[0]] < order[pair[1]] else pair[::-1])
+        return candidates
+
+    def collides(self, signature1: Tuple[int, ...], signature2: Tuple[int, ...]) -> bool:
+        if not signature1 or not signature2:
+            return False
+        for start in range(0, self.bands * self.rows, self.rows):
+            if signature1[start:start + self.rows] == signature2[start:start + self.rows]:
+                return True
+        return False
+
+    @staticmethod
+    def estimate(signature1: Tuple[int, ...], signature2: Tuple[int, ...]) -> float:
+        if not signature1 or not signature2:
+            return 0.0
+        return sum(1 for x, y in zip(signature1, signature2) if x == y) / len(signature1)
@@ -1,222 +1,136 @@
 from fastapi import FastAPI,Request,Form,Depends, HTTPException
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from typing import List, Dict
+from typing import List, Dict, Optional
 import time
+import asyncio
+import json
 
 #AI tools
-from ai_assistant import CodeEvaluator, TeacherAssistant,QuestionChecker
+from ai_assistant import AsyncCodeEvaluator, AsyncTeacherAssistant, AsyncQuestionChecker, AnswerInterrupted, close_async_api, usage_stats
+from ai_guard import get_guard
 
 
 #Database
-import ZODB, ZODB.FileStorage
-import BTrees._OOBTree
-import transaction
-from models import Professor, Student, Discussion,Chat_history,Quiz,Course,Response
+import database
+from ZODB.POSException import ConflictError
+from models import Professor, Student, Discussion,Chat_history,Quiz,Course,Response,SimilarityMatrix
 import globals 
 from datetime import date,datetime
 from data import Courses, Students,Professors, SKILLS
 
 
-#ast
-import ast
-from difflib import SequenceMatcher
-
-class ASTNormalizer(ast.NodeVisitor): 
-    def __init__(self):
-        self.structure = []
-        self.var_counter = 0
-        self.var_map = {}
-        
-    def generic_visit(self, node):
-        self.structure.append(type(node).__name__)
-        super().generic_visit(node)
-        
-    def visit_Name(self, node):
-        if node.id not in self.var_map:
-            self.var_map[node.id] = f"VAR_{self.var_counter}"
-            self.var_counter += 1
-        self.structure.append(f"Name:{self.var_map[node.id]}")
-        
-    def visit_Constant(self, node):
-        self.structure.append(f"Const:{type(node.value).__name__}")
-
-
-def normalize_code_ast(code: str) -> List[str]:
-    try:
-        tree = ast.parse(code)
-        normalizer = ASTNormalizer()
-        normalizer.visit(tree)
-        return normalizer.structure
-    except:
-        return []
-
-def tree_edit_distance(tree1: ast.AST, tree2: ast.AST) -> int:
-    def get_node_signature(node):
-        if isinstance(node, ast.Name):
-            return "Name"
-        elif isinstance(node, ast.Constant):
-            return f"Const_{type(node.value).__name__}"
-        else:
-            return type(node).__name__
-    
-    def tree_to_list(node):
-        result = [get_node_signature(node)]
-        for child in ast.iter_child_nodes(node):
-            result.extend(tree_to_list(child))
-        return result
-    
-    list1 = tree_to_list(tree1)
-    list2 = tree_to_list(tree2)
-    
-    m, n = len(list1), len(list2)
-    dp = [[0] * (n + 1) for _ in range(m + 1)]
-    
-    for i in range(m + 1):
-        dp[i][0] = i
-    for j in range(n + 1):
-        dp[0][j] = j
-    
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            if list1[i-1] == list2[j-1]:
-                dp[i][j] = dp[i-1][j-1]
-            else:
-                dp[i][j] = 1 + min(dp[i-1][j], dp[i][j-1], dp[i-1][j-1])
-    
-    return dp[m][n]
-
-def advanced_similarity(code1: str, code2: str) -> float:
-    try:
-        structure1 = normalize_code_ast(code1)
-        structure2 = normalize_code_ast(code2)
-        
-        if not structure1 or not structure2:
-            return 0.0
-        
-        matcher = SequenceMatcher(None, structure1, structure2)
-        struct_similarity = matcher.ratio() * 100
-        
-        tree1 = ast.parse(code1)
-        tree2 = ast.parse(code2)
-        distance = tree_edit_distance(tree1, tree2)
-        
-        max_nodes = max(len(list(ast.walk(tree1))), len(list(ast.walk(tree2))))
-        tree_similarity = max(0, (1 - distance / max_nodes) * 100) if max_nodes > 0 else 0
-        
-        return round((struct_similarity * 0.6 + tree_similarity * 0.4), 2)
-    except:
-        return 0.0
-
-
-def compare_all_submissions(student_codes: Dict[int, str]) -> Dict:
-    student_ids = list(student_codes.keys())
-    pairwise = []
-    stats = {sid: {"total": 0, "count": 0} for sid in student_ids}
-    
-    for i in range(len(student_ids)):
-        for j in range(i + 1, len(student_ids)):
-            id1, id2 = student_ids[i], student_ids[j]
-            sim = advanced_similarity(student_codes[id1], student_codes[id2])
-
-            pairwise.append({
-                "student1_id": id1,
-                "student2_id": id2,
-                "similarity": sim,
-                "flagged": sim > 75
-            })
-
-            stats[id1]["total"] += sim
-            stats[id1]["count"] += 1
-            stats[id2]["total"] += sim
-            stats[id2]["count"] += 1
-
-    individual = []
-    for sid in student_ids:
-        avg = (
-            stats[sid]["total"] / stats[sid]["count"]
-            if stats[sid]["count"] > 0 else 0
-        )
-        individual.append({
-            "student_id": sid,
-            "avg_similarity": round(avg, 2)
-        })
-
-    return {
-        "pairwise": pairwise,
-        "individual": individual,
-        "flagged_count": sum(1 for x in pairwise if x["flagged"]),
-        "total_comparisons": len(pairwise)
-    }
-
-def compare_across_quizzes(quiz_submissions: Dict[int, Dict[int, str]]) -> Dict:
-    results = []
-    
-    quiz_ids = list(quiz_submissions.keys())
-    
-    for student_id in {sid for q in quiz_submissions.values() for sid in q}:
-        for i in range(len(quiz_ids)):
-            for j in range(i + 1, len(quiz_ids)):
-                q1, q2 = quiz_ids[i], quiz_ids[j]
-                
-                if student_id in quiz_submissions[q1] and student_id in quiz_submissions[q2]:
-                    sim = advanced_similarity(
-                        quiz_submissions[q1][student_id],
-                        quiz_submissions[q2][student_id]
-                    )
-                    
-                    if sim > 50:
-                        results.append({
-                            "student_id": student_id,
-                            "quiz1": q1,
-                            "quiz2": q2,
-                            "similarity": sim,
-                            "flagged": sim > 75
-                        })
-    
-    return {
-        "cross_quiz_comparisons": results,
-        "high_similarity_count": len(results)
-    }
+#plagiarism detection
+from plagiarism import CROSS_QUIZ_THRESHOLD, compare_pairs_async, score_rows_async, shutdown_pool
+import config
+import analysis_jobs
+import sandbox
+
+def quiz_fingerprints(quiz):
+    responses = globals.root["responses"]
+    return {sid: responses[rid].get_fingerprint() for sid, rid in quiz.participated_students.items()}
+
+
+def similarity_is_current(quiz):
+    matrices = globals.root["similarity_matrices"]
+    if quiz.id not in matrices:
+        return not quiz.participated_students
+    stale, departed = matrices[quiz.id].stale_students(quiz_fingerprints(quiz))
+    return not stale and not departed
+
+
+async def refresh_similarity(quiz, progress=None):
+    """Rescore only the rows of the quiz's similarity matrix whose answers changed."""
+    matrices = globals.root["similarity_matrices"]
+    if quiz.id not in matrices:
+        matrices[quiz.id] = SimilarityMatrix.SimilarityMatrix(quiz.id)
+    matrix = matrices[quiz.id]
+    matrix.check_settings()
+
+    fingerprints = quiz_fingerprints(quiz)
+    stale, departed = matrix.stale_students(fingerprints)
+    if stale or departed:
+        scores = await score_rows_async(stale, fingerprints, matrix.signatures, progress)
+        matrix.update_rows(departed, {sid: fingerprints[sid] for sid in stale}, scores)
+    database.commit()
+    return matrix
+
+
+def index_submissions(quiz_id):
+    """Add the quiz's answers to the cross-quiz winnow index; answers already indexed are skipped"""
+    quiz = globals.root["quizzes"][quiz_id]
+    responses = globals.root["responses"]
+    index = globals.root["winnow_index"]
+    for sid, rid in quiz.participated_students.items():
+        if rid in responses:
+            index.add_response(responses[rid], quiz_id, sid)
+
+
+def start_similarity_job(quiz):
+    quiz_id = quiz.id
+
+    async def run(job):
+        # Indexed here rather than in submit_quiz, where every submission wrote the same postings buckets.
+        try:
+            database.run_in_session(lambda: index_submissions(quiz_id))
+        except ConflictError as e:
+            print(f"Could not index quiz {quiz_id} for cross-quiz search: {e}")
+        # The job outlives the request, so it loads the quiz again on a connection of its own.
+        await database.run_in_session_async(lambda: refresh_similarity(globals.root["quizzes"][quiz_id], job.update))
+
+    return analysis_jobs.start_job(quiz_id, run)
+
+#grading queue
+import grading
+import grading_queue
+
+async def grade_response(rid):
+    with database.session():
+        graded = await grading.evaluate_response(code_evaluator, rid)
+    # Storing is retried on its own, so a write conflict never costs a second call to the model.
+    if graded is not None:
+        database.run_in_session(lambda: grading.record_grade(rid, *graded))
+
+
+def give_up_grading(rid, error):
+    return database.run_in_session(lambda: grading.give_up_grading(rid, error))
+
+
+async def recover_grading():
+    # Picks up what workers that stopped without finishing left pending, including a previous run of this one.
+    while True:
+        await asyncio.sleep(config.WORKER_LEASE)
+        try:
+            for rid in database.run_in_session(grading.claim_orphans):
+                grading_queue.enqueue(rid)
+        except ConflictError as e:
+            print(f"Could not check for pending grading left by stopped workers: {e}")
 
 #FastAPI INITIALIZE
 app=FastAPI()
+app.add_middleware(database.SessionMiddleware)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates=Jinja2Templates(directory="templates")
-code_evaluator=CodeEvaluator()
-teacher_assistant=TeacherAssistant()
-question_checker=QuestionChecker()
+code_evaluator=AsyncCodeEvaluator()
+teacher_assistant=AsyncTeacherAssistant()
+question_checker=AsyncQuestionChecker()
 
 
-@app.on_event("startup")
-def startup_event():
+def seed_data():
     semester=2
-    storage = ZODB.FileStorage.FileStorage('mydata.fs')
-    db = ZODB.DB(storage)
-    globals.db = db
-    globals.connection = globals.db.open()
-    globals.root = globals.connection.root()
-
-    class_names = ['professors', 'courses', 'students', 'quizzes', 'discussions', 'chat_histories', 'responses']
-    for c in class_names:
-        if c not in globals.root:
-            globals.root[c] = BTrees._OOBTree.BTree()
-            transaction.commit()
-    
-    
     for c in Courses:
         if c[0] not in globals.root["courses"]:
             course=Course.Course(c[0],c[1],c[2])
             globals.root["courses"][c[0]]=course
-            transaction.commit()
+            database.commit()
     
     for p in Professors:
         
         if p[0] not in globals.root["professors"]:
             prof=Professor.Professor(p[0], p[1])
             globals.root["professors"][p[0]]=prof
-            transaction.commit()
+            database.commit()
         profe=globals.root["professors"][p[0]]
         for cr in p[2]:
             cous=globals.root["courses"][cr] 
@@ -224,7 +138,7 @@ def startup_event():
                 profe.courses.append(cous)
                 profe._p_changed = True  
                 cous.professor=profe.name
-        transaction.commit()
+        database.commit()
         
     
     for s in Students:
@@ -234,23 +148,37 @@ def startup_event():
                 student.skills[skill]=0
                 student._p_changed=True
             globals.root["students"][s[0]]=student
-            transaction.commit()
+            database.commit()
         stu=globals.root["students"][s[0]]
         course_list=globals.root["courses"]
         for c in course_list:
             if course_list[c].curriculum==((datetime.now().year+543)%100-stu.batch+1)*10+semester:
                 stu.enroll_course(course_list[c])
-        transaction.commit(
-            
-        )
+        database.commit()
+
+
+@app.on_event("startup")
+async def startup_event():
+    database.open_db()
+    database.start_heartbeat()
+    if config.SANDBOX_ENABLED and not sandbox.isolation_available():
+        print(f"Sandboxed pre-grading is on but {config.SANDBOX_BWRAP} or prlimit is missing; submissions go to the model")
+    # With several workers one seeds the data at a time; the others wait for it, then find nothing left to add.
+    await database.claim_startup()
+    database.run_in_session(seed_data)
+    database.finish_startup()
+    grading_queue.start(grade_response, give_up_grading, database.run_in_session(grading.claim_orphans))
+    app.state.grading_recovery = asyncio.create_task(recover_grading())
             
                 
 @app.on_event("shutdown")
-def shutdown_event():
-    transaction.commit()
-    if globals.connection:
-        globals.connection.close()
-    globals.db.close()
+async def shutdown_event():
+    app.state.grading_recovery.cancel()
+    await grading_queue.stop()
+    shutdown_pool()
+    await close_async_api()
+    await database.stop_heartbeat()
+    database.close_db()
 
 @app.get("/", response_class=HTMLResponse)
 async def show_home(request:Request):
@@ -320,6 +248,7 @@ async def show_quizzes(id: int, request: Request):
                         response = globals.root["responses"][rid]
                         quiz_responses[qu["id"]] = {
                             "score": response.score,
+                            "grading_status": response.grading_status,
                             "mistakes": response.mistakes,
                             "comments": response.comments
                         }
@@ -357,53 +286,25 @@ async def submit_quiz( sid: int, id: int, student_code: str = Form(...), system_
     quiz = globals.root["quizzes"][id]
     student = globals.root["students"][sid]
     
-    calculated_result = code_evaluator.evaluate_code(
-        quiz.question, quiz.sample_sol, student_code, 
-        quiz.languages, quiz.restriction, quiz.total_s
-    )
-    mathematical=[1006710,1006717,1006718,1006716,1006730,96642170,96642022]
-    programming=[1286121,1286120,1286131,1286222,1286228,1286232,1286391,1286233]
-    computer=[1286111,1286213,1286112]
-    networking=[1286241,1286223]
-    if(calculated_result[0]>0):
-        if quiz.course_id in mathematical:
-            student.skills["Mathematical & Analytical Skills"]+=calculated_result[0]
-            student._p_changed=True
-            
-        if quiz.course_id in programming:
-            student.skills["Programming & Software Development Skills"]+=calculated_result[0]
-            student._p_changed=True
-        
-        if quiz.course_id in computer:
-            student.skills["Computer Systems & Hardware Skills"]+=calculated_result[0]
-            student._p_changed=True
-        
-        if quiz.course_id in networking:
-            student.skills["Data & Networking Skills"]+=calculated_result[0]
-            student._p_changed=True
-    
-    print(student.skills)
-    
-    res_list = globals.root["responses"]
-    res_id = max(res_list.keys()) + 1 if res_list else 1
+    res_id = database.next_id("responses")
     
-    response = Response.Response(
-        res_id, quiz, student_code, calculated_result[0], 
-        calculated_result[1], calculated_result[2], datetime.now()
-    )
+    response = Response.Response(res_id, quiz, student_code, 0, None, None, datetime.now())
+    response.student_id = sid
+    response.grading_status = "pending"
     if system_log:
         response.system_log=system_log.split('@')
+    response.get_fingerprint()
     quiz.participated_students[sid] = res_id
-    quiz._p_changed = True  
     
     globals.root["responses"][res_id] = response
-    transaction.commit()
-    
+    grading.hold_for_grading(response)
     student.join_quiz(id)
     student._p_changed = True 
-    transaction.commit()
+    database.commit()
+
+    grading_queue.enqueue(res_id)
+    start_similarity_job(quiz)
     
-    print(calculated_result)
     quizzes = []
     for c in student.courses:
         quizzes += c.get_quizzes()
@@ -411,18 +312,19 @@ async def submit_quiz( sid: int, id: int, student_code: str = Form(...), system_
     return RedirectResponse(f"/student/{sid}/quizzes", status_code=303)
     
 @app.get("/student/{id}/discussions", response_class=HTMLResponse)
-async def show_discussions(id:int, request:Request):
-    discussions=[]
+async def show_discussions(id:int, request:Request, cursor:Optional[str]=None):
     student = globals.root["students"][id]
-    for d in globals.root["discussions"]:
-        if globals.root["discussions"][d].student.batch==student.batch:
-            discussions.append(globals.root["discussions"][d])
-    discussions.sort(key=lambda x: x.timestamp, reverse=True)
+    try:
+        ids, next_cursor = globals.root["discussion_index"].page(student.batch, cursor, config.DISCUSSION_PAGE_SIZE)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    discussions = [globals.root["discussions"][d] for d in ids]
     
     return templates.TemplateResponse("student_discussions.html", {
         "request":request, 
         "id":id, 
         "discussions": discussions,
+        "next_cursor": next_cursor,
         "student_name": student.name, 
         "version": int(time.time())
     })
@@ -430,13 +332,13 @@ async def show_discussions(id:int, request:Request):
 @app.post("/student/{id}/discussion/new")
 async def create_discussion(id:int, topic:str=Form(...), message:str=Form(...)):
     student=globals.root["students"][id]
-    d_list=globals.root["discussions"]
-    discussion_id = max(d_list.keys()) + 1 if d_list else 1
+    discussion_id = database.next_id("discussions")
     timestamp = datetime.now()
     
     new_discussion = Discussion.Discussion(discussion_id, student, topic, message, timestamp)
     globals.root["discussions"][discussion_id] = new_discussion
-    transaction.commit()
+    globals.root["discussion_index"].add_discussion(new_discussion)
+    database.commit()
     
     return RedirectResponse(f"/student/{id}/discussions", status_code=303)
 
@@ -447,7 +349,7 @@ async def edit_discussion(id:int, disc_id:int, topic:str=Form(...), message:str=
     if discussion.student == student:
         discussion.topic = topic
         discussion.message = message
-        transaction.commit()
+        database.commit()
     
     return RedirectResponse(f"/student/{id}/discussions", status_code=303)
 
@@ -457,7 +359,8 @@ async def delete_discussion(id:int, disc_id:int):
     discussion = globals.root["discussions"][disc_id]
     if discussion.student == student:
         del globals.root["discussions"][disc_id]
-        transaction.commit()
+        globals.root["discussion_index"].remove_discussion(disc_id)
+        database.commit()
     
     return RedirectResponse(f"/student/{id}/discussions", status_code=303)
 
@@ -466,7 +369,7 @@ async def add_comment(id:int, disc_id:int, content:str=Form(...)):
     student=globals.root["students"][id]
     discussion = globals.root["discussions"][disc_id]
     discussion.create_comment(student, content)
-    transaction.commit()
+    database.commit()
     
     return RedirectResponse(f"/student/{id}/discussions", status_code=303)
 
@@ -476,7 +379,7 @@ async def delete_comment(id:int, disc_id:int, comment_student_id:int=Form(...)):
     discussion = globals.root["discussions"][disc_id]   
     if comment_student_id == id and student in discussion.comment:
         del discussion.comment[student]
-        transaction.commit()
+        database.commit()
     
     return RedirectResponse(f"/student/{id}/discussions", status_code=303)
 
@@ -499,25 +402,52 @@ async def show_chat(id:int, chatid:int, request:Request):
                 "content": "Hello! I'm your AI tutor. How can I help you with your studies today?"})
         print(chatid, new_chat.messages, "added")
         new_chat._p_changed=True
-        transaction.commit()
+        database.commit()
         print("database",globals.root["chat_histories"][chatid].messages)
     return templates.TemplateResponse("student_chat.html", {"request":request, "id":id, "course":course,"history":chatlist[chatid].messages,"chatid":chatid, "version": int(time.time())})
 
 @app.post("/student/{student_id}/chat/{chat_id}", response_class=HTMLResponse)
-def send_prompt(student_id:int, chat_id:int, question:str=Form(...)):
+async def send_prompt(student_id:int, chat_id:int, question:str=Form(...)):
     chat_history = globals.root["chat_histories"][chat_id]
     chat_history.messages.append({"role":"student", "content":question})
     chat_history._p_changed=True
     course_id=int(str(chat_id)[len(str(student_id)):])
     course=globals.root["courses"][course_id]
-    response=teacher_assistant.chat(question,  course.name)
+    response=await teacher_assistant.chat(question,  course.name)
     chat_history.messages.append({"role":"TA", "content":response})
     chat_history._p_changed = True
-    transaction.commit()
+    database.commit()
     print("database",globals.root["chat_histories"][chat_id].messages)
 
     return RedirectResponse(f"/student/{student_id}/chat/{chat_id}", status_code=303)
 
+@app.post("/student/{student_id}/chat/{chat_id}/stream")
+async def stream_prompt(student_id:int, chat_id:int, question:str=Form(...)):
+    """Relays the tutor's answer as server-sent events, and saves the exchange once it ends"""
+    chat_history = globals.root["chat_histories"][chat_id]
+    course_id=int(str(chat_id)[len(str(student_id)):])
+    course=globals.root["courses"][course_id]
+
+    async def tokens():
+        parts = []
+        try:
+            async for text in teacher_assistant.stream_chat(question, course.name):
+                parts.append(text)
+                yield f"data: {json.dumps({'token': text})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except AnswerInterrupted as e:
+            # The page replaces the half-written answer with the message; only the message is saved.
+            parts = [str(e)]
+            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+        finally:
+            # Also runs when the student leaves mid-answer, so the question is not lost.
+            chat_history.messages.append({"role":"student", "content":question})
+            chat_history.messages.append({"role":"TA", "content":"".join(parts)})
+            chat_history._p_changed = True
+            database.commit()
+
+    return StreamingResponse(tokens(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.get("/student/{id}/profile", response_class=HTMLResponse)
 def show_profile(id:int, request:Request):
     student=globals.root["students"][id]
@@ -548,7 +478,7 @@ async def validate_question(id: int, request: Request):
         question = data.get('question')
         course_id = data.get('course_id')
         sample_output = data.get('sample_output')
-        restriction = data.get('restriction', 'None')
+        restriction = data.get('restriction') or 'None'#same default as the create_quiz form
 
         if course_id not in globals.root["courses"]:
             return {"correct": False, "message": "Course not found"}
@@ -556,7 +486,7 @@ async def validate_question(id: int, request: Request):
         course = globals.root["courses"][course_id]
         course_name = course.name
 
-        question_check_result = question_checker.check(
+        question_check_result = await question_checker.check(
             question, 
             course_name, 
             sample_output, 
@@ -589,15 +519,14 @@ async def create_quiz(
         course_obj = globals.root["courses"][course]
         courses = prof.get_courses()
 
-        question_check_result = question_checker.check(
+        question_check_result = await question_checker.check(
             question, 
             course_obj.name, 
             sample_output, 
             restriction
         )
 
-        quiz_list = globals.root["quizzes"]
-        quiz_id = max(quiz_list.keys()) + 1 if quiz_list else 1
+        quiz_id = database.next_id("quizzes")
         
         quiz = Quiz.Quiz(
             quiz_id, 
@@ -614,8 +543,9 @@ async def create_quiz(
         quiz.course_id = course
         
         globals.root["quizzes"][quiz_id] = quiz
+        globals.root["quiz_index"].add_quiz(quiz)
         quiz._p_changed = True
-        transaction.commit()
+        database.commit()
         
         print(globals.root["quizzes"][quiz_id].title + " is added")
 
@@ -633,7 +563,10 @@ async def create_quiz(
             }
         )
 
+    except ConflictError:
+        raise#SessionMiddleware replays the request on a fresh snapshot
     except Exception as e:
+        database.abort()#keep a half-made quiz out of the commit made for the error page
         print(f"Error creating quiz: {e}")
         prof = globals.root["professors"][id]
         courses = prof.get_courses()
@@ -650,6 +583,15 @@ async def create_quiz(
             }
         )
 
+@app.post("/professor/{id}/quiz/{qid}/regrade")
+async def regrade_quiz(id: int, qid: int):
+    quiz = globals.root["quizzes"][qid]
+    pending = grading.mark_for_regrade(quiz)
+    database.commit()
+    for rid in pending:
+        grading_queue.enqueue(rid)
+    return RedirectResponse(f"/professor/{id}/quiz/{qid}/submissions", status_code=303)
+
 @app.get("/professor/{id}/quiz/{qid}/submissions", response_class=HTMLResponse)
 async def show_quiz_submissions(id:int,qid:int, request:Request):
     prof = globals.root["professors"][id]
@@ -682,14 +624,29 @@ async def quiz_analysis(request: Request, pid: int, qid: int):
     print(submissions , "SUBMMMM")
 
     has_submissions=  True if submissions else False
-    student_codes = {}
     student_names = {}
-    respons=root["responses"]
     for student in submissions:
-        student_codes[student] = respons[submissions[student]].answer
         student_names[student] = root["students"][student].name
 
-    current_analysis = compare_all_submissions(student_codes)
+    analysis_job = None
+    job = analysis_jobs.get_job(qid)
+    if (job is not None and job.status in ("queued", "running")) or not similarity_is_current(quiz):
+        job = start_similarity_job(quiz)
+        if job is None:
+            # Another worker is running the analysis; the page follows it over SSE and reloads.
+            analysis_job = analysis_jobs.progress(qid) or analysis_jobs.AnalysisJob(qid).snapshot()
+        else:
+            await asyncio.wait({job.task}, timeout=config.ANALYSIS_INLINE_WAIT)
+            # Start a new snapshot so the matrix the job just committed is visible.
+            database.commit()
+            if job.status != "done":
+                # Too slow to wait for; the page follows progress over SSE and reloads.
+                analysis_job = job.snapshot()
+
+    current_analysis = {"individual": [], "flagged_count": 0, "total_comparisons": 0}
+    if analysis_job is None and qid in root["similarity_matrices"]:
+        # Pairwise results are fetched page by page from analysis/pairs.
+        current_analysis = root["similarity_matrices"][qid].summary(list(submissions.keys()))
 
 
     return templates.TemplateResponse("quiz_analysis.html", {
@@ -699,10 +656,136 @@ async def quiz_analysis(request: Request, pid: int, qid: int):
         "current_quiz": quiz,
         "student_names": student_names,
         "current_analysis": current_analysis,
+        "flag_threshold": config.PLAGIARISM_FLAG_THRESHOLD,
+        "analysis_job": analysis_job,
         "has_submissions":has_submissions
     })
 
 
+@app.get("/professor/{pid}/quiz/{qid}/analysis/progress")
+async def quiz_analysis_progress(pid: int, qid: int):
+    """Server-Sent Events stream of the quiz's background analysis job, whichever worker runs it"""
+    async def events():
+        last = None
+        while True:
+            snapshot = analysis_jobs.progress(qid)
+            if snapshot is None:
+                # No worker has claimed a job; "unknown" makes the page reload, which starts one if the matrix is out of date.
+                current = database.run_in_session(lambda: similarity_is_current(globals.root["quizzes"][qid]))
+                snapshot = {"quiz_id": qid, "status": "done" if current else "unknown", "percentage": 100 if current else 0}
+            if snapshot != last:
+                yield f"data: {json.dumps(snapshot)}\n\n"
+                last = snapshot
+            if snapshot["status"] in ("done", "failed", "unknown", "stalled"):
+                break
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def encode_pair_cursor(comparison):
+    return f"{comparison['similarity']}_{comparison['student1_id']}_{comparison['student2_id']}"
+
+
+def decode_pair_cursor(cursor):
+    similarity, sid1, sid2 = cursor.split("_")
+    return (-float(similarity), int(sid1), int(sid2))
+
+
+@app.get("/professor/{pid}/quiz/{qid}/analysis/pairs")
+async def quiz_analysis_pairs(pid: int, qid: int, limit: int = 50, cursor: str = None, flagged: bool = False, student: int = None):
+    """Pairwise results, most similar first, one page at a time"""
+    if qid not in globals.root["quizzes"]:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    matrices = globals.root["similarity_matrices"]
+    if qid not in matrices:
+        return {"pairs": [], "next_cursor": None}
+
+    limit = max(1, min(limit, 200))
+    try:
+        after = decode_pair_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    pairs = matrices[qid].top_pairs(limit + 1, after, flagged, student)
+    next_cursor = encode_pair_cursor(pairs[limit - 1]) if len(pairs) > limit else None
+    pairs = pairs[:limit]
+
+    students = globals.root["students"]
+    for comparison in pairs:
+        comparison["student1_name"] = students[comparison["student1_id"]].name
+        comparison["student2_name"] = students[comparison["student2_id"]].name
+    return {"pairs": pairs, "next_cursor": next_cursor}
+
+
+@app.get("/professor/{id}/response/{rid}/matches")
+async def response_matches(id: int, rid: int):
+    """Earlier submissions that share winnowed fingerprints with this response"""
+    index = globals.root["winnow_index"]
+    if rid not in index.documents:
+        if rid not in globals.root["responses"]:
+            raise HTTPException(status_code=404, detail="Response not found")
+        response = globals.root["responses"][rid]
+        quiz = response.quiz
+        for sid in quiz.participated_students:
+            if quiz.participated_students[sid] == rid:
+                index.add_response(response, quiz.id, sid)
+                database.commit()
+        if rid not in index.documents:
+            return {"response_id": rid, "matches": []}
+    return {"response_id": rid, "matches": index.matches(rid, earlier_only=True)}
+
+
+@app.get("/professor/{id}/ai/usage")
+async def ai_usage(id: int):
+    """Prompt and completion tokens per kind of AI call since the server started"""
+    return usage_stats()
+
+
+@app.get("/professor/{id}/ai/status")
+async def ai_status(id: int):
+    """Health of the AI provider as the shared guard sees it, and grading work waiting on it"""
+    return dict(get_guard().status(), grading_pending=grading_queue.pending_count(), grading_deferred=grading_queue.deferred_count())
+
+
+@app.get("/professor/{id}/tutor/cache-stats")
+async def tutor_cache_stats(id: int):
+    """How often the AI tutor answered this professor's courses from its cache"""
+    prof = globals.root["professors"][id]
+    return teacher_assistant.cache_stats([c.name for c in prof.get_courses()])
+
+
+@app.get("/professor/{id}/student/{sid}/self-reuse")
+async def student_self_reuse(id: int, sid: int):
+    """This student's answers to different quizzes that are structurally similar"""
+    index = globals.root["winnow_index"]
+    responses = globals.root["responses"]
+    candidates = index.self_reuse(sid)
+    pairs = [(rid1, rid2) for rid1, rid2, _ in candidates]
+    fingerprints = {rid: responses[rid].get_fingerprint() for pair in pairs for rid in pair}
+    scores = await compare_pairs_async(fingerprints, pairs, CROSS_QUIZ_THRESHOLD)
+
+    results = []
+    for rid1, rid2, overlap in candidates:
+        sim = scores[(rid1, rid2)]
+        if sim > CROSS_QUIZ_THRESHOLD:
+            results.append({
+                "student_id": sid,
+                "quiz1": index.documents[rid1]["quiz_id"],
+                "quiz2": index.documents[rid2]["quiz_id"],
+                "response1": rid1,
+                "response2": rid2,
+                "overlap": overlap,
+                "similarity": sim,
+                "flagged": sim > config.PLAGIARISM_FLAG_THRESHOLD
+            })
+    results.sort(key=lambda x: x["similarity"], reverse=True)
+    return {
+        "cross_quiz_comparisons": results,
+        "high_similarity_count": len(results)
+    }
+
+
 @app.post("/professor/{id}/quiz/{qid}/{sid}/update-score")
 async def update_score(id: int, qid: int, sid: int, score:int=Form(...) ):
     
@@ -714,7 +797,7 @@ async def update_score(id: int, qid: int, sid: int, score:int=Form(...) ):
             response.score = score
             response._p_changed = True
             quiz._p_changed=True
-            transaction.commit()
+            database.commit()
     return RedirectResponse(f"/professor/{id}/quiz/{qid}/{sid}/responses", status_code=303)
 
 @app.get("/professor/{id}/courses", response_class=HTMLResponse)
@@ -0,0 +1,127 @@
+"""Offline maintenance commands.
+
+Usage:
+    python manage.py backfill-winnow
+    python manage.py grade-cache-stats
+    python manage.py reindex-quizzes
+    python manage.py reindex-discussions
+    python manage.py regrade --quiz 12 [--resume] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import transaction
+import globals
+import database
+import grading
+import grading_queue
+from ai_assistant import AsyncCodeEvaluator, close_async_api
+
+
+def backfill_winnow(args):
+    index = globals.root["winnow_index"]
+    responses = globals.root["responses"]
+    indexed = 0
+    for qid in globals.root["quizzes"]:
+        quiz = globals.root["quizzes"][qid]
+        for sid in quiz.participated_students:
+            rid = quiz.participated_students[sid]
+            if rid in responses and index.add_response(responses[rid], qid, sid):
+                indexed += 1
+                if indexed % args.batch_size == 0:
+                    transaction.commit()
+                    print(f"indexed {indexed} responses")
+    transaction.commit()
+    print(f"done, indexed {indexed} responses")
+
+
+def grade_cache_stats(args):
+    for name, value in globals.root["grade_cache"].stats().items():
+        print(f"{name}: {value}")
+
+
+def reindex_quizzes(args):
+    globals.root["quiz_index"].rebuild(globals.root["quizzes"])
+    transaction.commit()
+    print(f"done, indexed {len(globals.root['quizzes'])} quizzes")
+
+
+def reindex_discussions(args):
+    globals.root["discussion_index"].rebuild(globals.root["discussions"])
+    transaction.commit()
+    print(f"done, indexed {len(globals.root['discussions'])} discussions")
+
+
+def regrade(args):
+    if args.quiz not in globals.root["quizzes"]:
+        raise SystemExit(f"no quiz with id {args.quiz}")
+    asyncio.run(_regrade(globals.root["quizzes"][args.quiz], args))
+    print(f"done, {globals.root['grade_cache'].stats()['hit_rate']}% of lookups served from the grade cache")
+
+
+async def _regrade(quiz, args):
+    # Beats like a server worker, so servers sharing the database leave the responses claimed here alone.
+    database.start_heartbeat()
+    if args.resume:
+        # Responses leave the pending set as they are graded, so --resume picks up the rest no live worker holds.
+        pending = grading.claim_orphans(quiz.participated_students.values())
+    else:
+        pending = grading.mark_for_regrade(quiz)
+    transaction.commit()
+    print(f"regrading {len(pending)} responses")
+    evaluator = AsyncCodeEvaluator()
+    done = 0
+
+    def graded():
+        nonlocal done
+        done += 1
+        if done % args.batch_size == 0:
+            transaction.commit()
+            print(f"graded {done}/{len(pending)}")
+
+    async def grade(rid):
+        await grading.grade_response(evaluator, rid)
+        graded()
+
+    def give_up(rid, error):
+        # Nothing waits for deferred responses here; they stay pending for --resume or the server.
+        grading.give_up_grading(rid, error)
+        graded()
+
+    grading_queue.start(grade, give_up, pending, args.concurrency)
+    try:
+        await grading_queue.drain()
+    finally:
+        await grading_queue.stop()
+        transaction.commit()
+        await close_async_api()
+        await database.stop_heartbeat()
+
+
+COMMANDS = {
+    "backfill-winnow": backfill_winnow,
+    "grade-cache-stats": grade_cache_stats,
+    "regrade": regrade,
+    "reindex-discussions": reindex_discussions,
+    "reindex-quizzes": reindex_quizzes,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CodeHive maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--db", default="mydata.fs", help="path to the FileStorage file")
+    parser.add_argument("--batch-size", type=int, default=200, help="commit after this many updates")
+    parser.add_argument("--quiz", type=int, help="quiz to regrade")
+    parser.add_argument("--resume", action="store_true", help="only grade responses left pending by an interrupted regrade")
+    parser.add_argument("--concurrency", type=int, default=None, help="requests to the model at once (default CODEHIVE_GRADING_WORKERS)")
+    args = parser.parse_args()
+
+    database.open_db(args.db)
+    try:
+        COMMANDS[args.command](args)
+    finally:
+        database.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import time
+import persistent
+
+
+class AnalysisClaim(persistent.Persistent):
+    """The worker running a quiz's similarity job, so workers sharing the database never run it twice at once"""
+
+    def __init__(self, quiz_id, owner):
+        self.quiz_id = quiz_id
+        self.owner = owner#database.WORKER_ID of the claiming worker
+        self.status = "running"
+        self.rerun = False#another worker got a submission mid-run and asked for one more pass
+        self.error = None
+        self.pairs_done = 0#progress as last saved by the owner
+        self.pairs_total = 0
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def running(self):
+        return self.status == "running"
+
+    def percentage(self):
+        if self.status == "done":
+            return 100
+        if self.pairs_total == 0:
+            return 0
+        return round(self.pairs_done / self.pairs_total * 100)
+
+    def snapshot(self):
+        return {
+            "quiz_id": self.quiz_id,
+            "status": self.status,
+            "pairs_done": self.pairs_done,
+            "pairs_total": self.pairs_total,
+            "percentage": self.percentage(),
+            "error": self.error
+        }
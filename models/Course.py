@@ -11,11 +11,5 @@ class Course(persistent.Persistent):
         
     
     def get_quizzes(self):
-        quizzes=[]
-        for quiz in globals.root["quizzes"]:
-            if globals.root["quizzes"][quiz].course_id==self.id:
-                quizzes.append(globals.root["quizzes"][quiz])
-        return quizzes
-                
-
-    
\ No newline at end of file
+        quizzes=globals.root["quizzes"]
+        return [quizzes[qid] for qid in globals.root["quiz_index"].course_quiz_ids(self.id) if qid in quizzes]
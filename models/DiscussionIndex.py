@@ -0,0 +1,63 @@
+import itertools
+import persistent
+from BTrees.LOBTree import LOBTree
+from BTrees.OOBTree import OOBTree
+
+
+def feed_key(discussion):
+    # Newest first in ascending key order; the id breaks ties between posts made in the same instant.
+    return (-discussion.timestamp.timestamp(), -discussion.id)
+
+
+def encode_cursor(key):
+    return f"{-key[0]!r}_{-key[1]}"
+
+
+def decode_cursor(cursor):
+    timestamp, did = cursor.split("_")
+    return (-float(timestamp), -int(did))
+
+
+class DiscussionIndex(persistent.Persistent):
+    def __init__(self):
+        self.by_batch = OOBTree()#batch -> OOBTree of feed key -> discussion id
+        self.entries = LOBTree()#discussion id -> (batch, feed key)
+
+    def add_discussion(self, discussion):
+        self.remove_discussion(discussion.id)
+        batch = discussion.student.batch
+        key = feed_key(discussion)
+        if batch not in self.by_batch:
+            self.by_batch[batch] = OOBTree()
+        self.by_batch[batch][key] = discussion.id
+        self.entries[discussion.id] = (batch, key)
+
+    def remove_discussion(self, did):
+        entry = self.entries.get(did)
+        if entry is None:
+            return
+        batch, key = entry
+        del self.by_batch[batch][key]
+        del self.entries[did]
+
+    def rebuild(self, discussions):
+        self.by_batch.clear()
+        self.entries.clear()
+        for did in discussions:
+            self.add_discussion(discussions[did])
+
+    def page(self, batch, cursor=None, size=20):
+        """Ids of up to size discussions of a batch, newest first, after cursor; and the cursor for the next page"""
+        feed = self.by_batch.get(batch)
+        if feed is None:
+            return [], None
+        if cursor is None:
+            items = feed.items()
+        else:
+            items = feed.items(min=decode_cursor(cursor), excludemin=True)
+        # One extra item tells whether there is a next page without counting the rest.
+        items = list(itertools.islice(items, size + 1))
+        if len(items) <= size:
+            return [did for _, did in items], None
+        items = items[:size]
+        return [did for _, did in items], encode_cursor(items[-1][0])
@@ -0,0 +1,101 @@
+import ast
+import hashlib
+import re
+import time
+import persistent
+from ZODB.POSException import ConflictError
+from BTrees.LOBTree import LOBTree
+from BTrees.OOBTree import OOBTree, OOTreeSet
+import config
+
+
+def normalize_source(code):
+    """The code without comments or layout, so cosmetic edits share an entry."""
+    try:
+        return ast.unparse(ast.parse(code))
+    except (SyntaxError, ValueError):
+        lines = (re.sub(r"\s+", " ", line).strip() for line in code.splitlines())
+        return "\n".join(line for line in lines if line)
+
+
+def cache_key(quiz, student_code):
+    parts = (quiz.question, quiz.sample_sol, normalize_source(student_code), quiz.languages, quiz.restriction, quiz.total_s)
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+class GradeCache(persistent.Persistent):
+    def __init__(self):
+        self.entries = OOBTree()#key -> (result, last use, quiz id)
+        self.recency = LOBTree()#last use -> key, least recently used first
+        self.by_quiz = LOBTree()#quiz id -> OOTreeSet of keys
+        self.size = 0
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _touch(self, key, result, quiz_id):
+        entry = self.entries.get(key)
+        if entry is not None:
+            del self.recency[entry[1]]
+        else:
+            self.size += 1
+        # Wall-clock based, so grading workers on different connections never pick the same recency key.
+        self.clock = max(self.clock + 1, time.time_ns())
+        self.entries[key] = (result, self.clock, quiz_id)
+        self.recency[self.clock] = key
+
+    def _remove(self, key):
+        result, last_use, quiz_id = self.entries.pop(key)
+        del self.recency[last_use]
+        self.size -= 1
+        keys = self.by_quiz.get(quiz_id)
+        if keys is not None and key in keys:
+            keys.remove(key)
+            if not keys:
+                del self.by_quiz[quiz_id]
+
+    def peek(self, key):
+        # Unlike get, leaves the counters and recency alone.
+        entry = self.entries.get(key)
+        return None if entry is None else list(entry[0])
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(key, entry[0], entry[2])
+        return list(entry[0])
+
+    def put(self, key, result, quiz_id):
+        self._touch(key, tuple(result), quiz_id)
+        if quiz_id not in self.by_quiz:
+            self.by_quiz[quiz_id] = OOTreeSet()
+        self.by_quiz[quiz_id].add(key)
+        while self.size > config.GRADE_CACHE_SIZE:
+            self._remove(self.recency[self.recency.minKey()])
+
+    def invalidate_quiz(self, quiz_id):
+        for key in list(self.by_quiz.get(quiz_id, ())):
+            if key in self.entries:
+                self._remove(key)
+
+    def _p_resolveConflict(self, old, committed, new):
+        # Concurrent gradings each bump the counters; the trees merge on their own.
+        resolved = dict(committed)
+        for name in ("size", "hits", "misses"):
+            resolved[name] = committed[name] + new[name] - old[name]
+        resolved["clock"] = max(committed["clock"], new["clock"])
+        if any(resolved[name] != new[name] for name in ("entries", "recency", "by_quiz")):
+            raise ConflictError
+        return resolved
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0
+        }
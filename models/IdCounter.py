@@ -0,0 +1,7 @@
+import persistent
+
+
+class IdCounter(persistent.Persistent):
+    # Deliberately without conflict resolution: two processes reserving the same block must not both succeed.
+    def __init__(self, value=0):
+        self.value = value#highest id handed out to any process
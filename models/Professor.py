@@ -14,19 +14,5 @@ class Professor(persistent.Persistent):
         return self.courses
     
     def get_quizzes(self):
-        
-        created_quizzes = []
-        for quiz_id in globals.root["quizzes"]:
-            if globals.root["quizzes"][quiz_id].professor_id == self.id:
-                    created_quizzes.append(globals.root["quizzes"][quiz_id])
-        
-        
-        return created_quizzes
-       
-
-
-
-
-        
-        
-
+        quizzes=globals.root["quizzes"]
+        return [quizzes[qid] for qid in globals.root["quiz_index"].professor_quiz_ids(self.id) if qid in quizzes]
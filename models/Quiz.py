@@ -1,6 +1,6 @@
 import persistent
 from persistent import Persistent
-from persistent.mapping import PersistentMapping
+from BTrees.OOBTree import OOBTree
 class Quiz(persistent.Persistent):
     def __init__(self, id=0, title="", question="", languages="Any", sample_sol="", duedate=None, 
                  duration=0, restriction="None", total_s=0):
@@ -13,10 +13,17 @@ class Quiz(persistent.Persistent):
         self.duration = duration
         self.restriction = restriction
         self.total_s = total_s
-        self.participated_students = PersistentMapping()#map with id
+        self.participated_students = OOBTree()#student id -> response id; a BTree so concurrent submissions merge
         self.professor_id = None  
         self.course_id = None  
 
+    def convert_participants(self):
+        # Quizzes created before participants moved to an OOBTree still hold a PersistentMapping.
+        if isinstance(self.participated_students, OOBTree):
+            return False
+        self.participated_students = OOBTree(self.participated_students)
+        return True
+
     def show_student_list(self):
         return self.participated_students
     
@@ -0,0 +1,27 @@
+import persistent
+from BTrees.OOBTree import OOBTree
+from BTrees.IOBTree import IOTreeSet
+
+
+class QuizIndex(persistent.Persistent):
+    def __init__(self):
+        self.by_course = OOBTree()#course id -> IOTreeSet of quiz ids
+        self.by_professor = OOBTree()#professor id -> IOTreeSet of quiz ids
+
+    def add_quiz(self, quiz):
+        for index, key in ((self.by_course, quiz.course_id), (self.by_professor, quiz.professor_id)):
+            if key not in index:
+                index[key] = IOTreeSet()
+            index[key].add(quiz.id)
+
+    def rebuild(self, quizzes):
+        self.by_course.clear()
+        self.by_professor.clear()
+        for qid in quizzes:
+            self.add_quiz(quizzes[qid])
+
+    def course_quiz_ids(self, course_id):
+        return self.by_course.get(course_id, ())
+
+    def professor_quiz_ids(self, professor_id):
+        return self.by_professor.get(professor_id, ())
@@ -1,7 +1,17 @@
 import persistent
+from plagiarism import answer_hash, fingerprint_code
 
 
 class Response(persistent.Persistent):
+    # Defaults for responses stored before grading was queued.
+    student_id=None
+    grading_status="graded"#pending, graded or failed
+    grading_error=None
+    awarded_points=None#skill points this response has credited so far
+    regrading=False
+    deferrals=0#times grading was put off after every retry failed
+    grading_owner=None#database.WORKER_ID of the worker grading it while pending
+
     def __init__(self, id=0, quiz=None, answer="", score=0, mistakes=None, comments=None, time_stamp=""):
         self.id=id
         self.quiz=quiz#object
@@ -11,7 +21,21 @@ class Response(persistent.Persistent):
         self.comments=comments
         self.submitted_time=time_stamp
         self.system_log=None
-        
+        self.fingerprint=None
+        self.student_id=None
+        self.grading_status="graded"
+        self.grading_error=None
+        self.awarded_points=0
+        self.regrading=False
+        self.deferrals=0
+        self.grading_owner=None
+
+    def get_fingerprint(self):
+        # Responses stored before fingerprints existed have no attribute yet.
+        fingerprint = getattr(self, "fingerprint", None)
+        if fingerprint is None or fingerprint.answer_hash != answer_hash(self.answer):
+            self.fingerprint = fingerprint_code(self.answer)
+        return self.fingerprint
         
 
     
@@ -0,0 +1,163 @@
+import heapq
+import persistent
+from BTrees.OOBTree import OOBTree
+import config
+
+
+def pair_key(sid1, sid2):
+    return (sid1, sid2) if sid1 < sid2 else (sid2, sid1)
+
+
+class SimilarityMatrix(persistent.Persistent):
+    exact_counts = None#matrices saved before estimated pairs were left out of the averages
+
+    def __init__(self, quiz_id=0):
+        self.quiz_id = quiz_id
+        self.pairs = OOBTree()#(sid1, sid2) with sid1 < sid2 -> (similarity, estimated)
+        self.answer_hashes = OOBTree()#sid -> hash of the answer its row was scored from
+        self.signatures = OOBTree()#sid -> MinHash signature, for LSH on large quizzes
+        self.lsh_settings = None
+        self.totals = OOBTree()#sid -> sum of exactly scored similarities
+        self.counts = OOBTree()#sid -> pairs stored, estimated ones included
+        self.exact_counts = OOBTree()#sid -> pairs in totals
+        self.flagged_count = 0
+        self.flag_threshold = config.PLAGIARISM_FLAG_THRESHOLD
+
+    def _add(self, key, similarity, estimated):
+        self.pairs[key] = (similarity, estimated)
+        for sid in key:
+            self.counts[sid] = self.counts.get(sid, 0) + 1
+            if not estimated:
+                self.totals[sid] = self.totals.get(sid, 0) + similarity
+                self.exact_counts[sid] = self.exact_counts.get(sid, 0) + 1
+        if not estimated and similarity > self.flag_threshold:
+            self.flagged_count += 1
+
+    def _discard(self, key):
+        similarity, estimated = self.pairs.pop(key)
+        for sid in key:
+            self.counts[sid] -= 1
+            if not estimated:
+                self.totals[sid] -= similarity
+                self.exact_counts[sid] -= 1
+        if not estimated and similarity > self.flag_threshold:
+            self.flagged_count -= 1
+
+    def remove_student(self, sid):
+        for key in list(self.pairs.keys(min=(sid,), max=(sid + 1,), excludemax=True)):
+            self._discard(key)
+        for other in list(self.answer_hashes.keys(max=sid, excludemax=True)):
+            if (other, sid) in self.pairs:
+                self._discard((other, sid))
+        for tree in (self.answer_hashes, self.totals, self.counts, self.exact_counts):
+            if sid in tree:
+                del tree[sid]
+
+    def check_settings(self):
+        if self.exact_counts is None:
+            self._recount()
+        if self.lsh_settings != (config.LSH_BANDS, config.LSH_ROWS, config.LSH_SHINGLE_SIZE):
+            self.signatures.clear()
+            self.lsh_settings = (config.LSH_BANDS, config.LSH_ROWS, config.LSH_SHINGLE_SIZE)
+        if self.flag_threshold != config.PLAGIARISM_FLAG_THRESHOLD:
+            self.flag_threshold = config.PLAGIARISM_FLAG_THRESHOLD
+            self.flagged_count = sum(1 for sim, estimated in self.pairs.values() if not estimated and sim > self.flag_threshold)
+
+    def _recount(self):
+        self.exact_counts = OOBTree()
+        for sid in self.counts.keys():
+            self.totals[sid] = 0
+            self.exact_counts[sid] = 0
+        for key, (similarity, estimated) in self.pairs.items():
+            if not estimated:
+                for sid in key:
+                    self.totals[sid] += similarity
+                    self.exact_counts[sid] += 1
+
+    def stale_students(self, fingerprints):
+        """Rows that must be rescored, and students that no longer submitted.
+
+        A row is stale when its answer changed, or when it is missing pairs
+        because two submissions were scored at the same time.
+        """
+        departed = [sid for sid in self.answer_hashes.keys() if sid not in fingerprints]
+        expected_count = len(fingerprints) - 1
+        stale = [
+            sid for sid, fingerprint in fingerprints.items()
+            if self.answer_hashes.get(sid) != fingerprint.answer_hash
+            or self.counts.get(sid, 0) - sum(1 for other in departed if pair_key(sid, other) in self.pairs) != expected_count
+        ]
+        return stale, departed
+
+    def update_rows(self, departed, fingerprints, scores):
+        for sid in departed:
+            self.remove_student(sid)
+            if sid in self.signatures:
+                del self.signatures[sid]
+        for sid in fingerprints:
+            self.remove_student(sid)
+        for key, (similarity, estimated) in scores.items():
+            if key in self.pairs:
+                self._discard(key)
+            self._add(key, similarity, estimated)
+        for sid, fingerprint in fingerprints.items():
+            self.answer_hashes[sid] = fingerprint.answer_hash
+            self.totals.setdefault(sid, 0)
+            self.counts.setdefault(sid, 0)
+            self.exact_counts.setdefault(sid, 0)
+
+    def _comparison(self, key, value):
+        similarity, estimated = value
+        comparison = {
+            "student1_id": key[0],
+            "student2_id": key[1],
+            "similarity": similarity,
+            "flagged": not estimated and similarity > self.flag_threshold
+        }
+        if estimated:
+            comparison["below_threshold"] = True
+            comparison["estimated"] = True
+        return comparison
+
+    def _student_pairs(self, sid):
+        for key, value in self.pairs.items(min=(sid,), max=(sid + 1,), excludemax=True):
+            yield key, value
+        for other in self.answer_hashes.keys(max=sid, excludemax=True):
+            value = self.pairs.get((other, sid))
+            if value is not None:
+                yield (other, sid), value
+
+    def top_pairs(self, limit, after=None, flagged_only=False, student_id=None):
+        """Highest-similarity pairs, ordered by (-similarity, sid1, sid2).
+
+        after is the sort key of the last pair already returned. Uses a
+        bounded heap, so the full pair list is never sorted.
+        """
+        items = self._student_pairs(student_id) if student_id is not None else self.pairs.items()
+
+        def eligible():
+            for key, value in items:
+                similarity, estimated = value
+                if flagged_only and (estimated or similarity <= self.flag_threshold):
+                    continue
+                if after is not None and (-similarity, key[0], key[1]) <= after:
+                    continue
+                yield key, value
+
+        top = heapq.nsmallest(limit, eligible(), key=lambda item: (-item[1][0], item[0][0], item[0][1]))
+        return [self._comparison(key, value) for key, value in top]
+
+    def summary(self, student_ids):
+        individual = []
+        for sid in student_ids:
+            count = self.exact_counts.get(sid, 0)
+            individual.append({
+                "student_id": sid,
+                "avg_similarity": round(self.totals[sid] / count, 2) if count > 0 else 0
+            })
+
+        return {
+            "individual": individual,
+            "flagged_count": self.flagged_count,
+            "total_comparisons": len(self.pairs)
+        }
@@ -0,0 +1,112 @@
+import itertools
+from datetime import datetime
+import persistent
+from BTrees.LOBTree import LOBTree
+from BTrees.OOBTree import OOTreeSet
+import config
+from winnowing import kgram_hashes, winnow
+
+
+def _submitted(response):
+    submitted = getattr(response, "submitted_time", None)
+    return submitted.timestamp() if isinstance(submitted, datetime) else None
+
+
+def _order(rid, document):
+    # Ids are handed out in blocks, so they do not follow submission order; documents indexed
+    # before times were stored sort first, by id, as they predate block allocation.
+    return (document.get("submitted") or 0, rid)
+
+
+class WinnowIndex(persistent.Persistent):
+    def __init__(self):
+        self.postings = LOBTree()#winnowed hash -> OOTreeSet of (response id, position)
+        self.documents = LOBTree()#response id -> what was indexed for it
+        self.by_student = LOBTree()#student id -> OOTreeSet of response ids
+
+    def add_response(self, response, quiz_id, student_id):
+        fingerprint = response.get_fingerprint()
+        document = self.documents.get(response.id)
+        if document is not None and document["answer_hash"] == fingerprint.answer_hash and "submitted" in document:
+            return False
+        self.remove_response(response.id)
+
+        selected = tuple(winnow(kgram_hashes(fingerprint.tokens, config.WINNOW_K), config.WINNOW_WINDOW))
+        for h, position in selected:
+            if h not in self.postings:
+                self.postings[h] = OOTreeSet()
+            self.postings[h].add((response.id, position))
+        self.documents[response.id] = {
+            "answer_hash": fingerprint.answer_hash,
+            "quiz_id": quiz_id,
+            "student_id": student_id,
+            "submitted": _submitted(response),
+            "fingerprints": selected,
+            "distinct": len({h for h, _ in selected}),
+        }
+        if student_id not in self.by_student:
+            self.by_student[student_id] = OOTreeSet()
+        self.by_student[student_id].add(response.id)
+        return True
+
+    def remove_response(self, rid):
+        document = self.documents.get(rid)
+        if document is None:
+            return
+        for h, position in document["fingerprints"]:
+            postings = self.postings.get(h)
+            if postings is not None:
+                postings.discard((rid, position))
+                if not postings:
+                    del self.postings[h]
+        self.by_student[document["student_id"]].discard(rid)
+        del self.documents[rid]
+
+    def matches(self, rid, candidates=None, earlier_only=False):
+        """Indexed responses sharing winnowed fingerprints with response rid.
+
+        Only the postings of rid's own hashes are read, and hashes shared by
+        more than WINNOW_MAX_POSTINGS positions are skipped as boilerplate.
+        earlier_only keeps responses submitted before rid.
+        """
+        document = self.documents[rid]
+        order = _order(rid, document)
+        shared = {}
+        for h in {h for h, _ in document["fingerprints"]}:
+            postings = list(itertools.islice(self.postings.get(h, ()), config.WINNOW_MAX_POSTINGS + 1))
+            if len(postings) > config.WINNOW_MAX_POSTINGS:
+                continue
+            for other in {other for other, _ in postings}:
+                if other == rid or (earlier_only and _order(other, self.documents[other]) > order):
+                    continue
+                if candidates is not None and other not in candidates:
+                    continue
+                shared[other] = shared.get(other, 0) + 1
+
+        results = []
+        for other, count in shared.items():
+            other_document = self.documents[other]
+            smaller = min(document["distinct"], other_document["distinct"]) or 1
+            results.append({
+                "response_id": other,
+                "quiz_id": other_document["quiz_id"],
+                "student_id": other_document["student_id"],
+                "shared": count,
+                "overlap": round(count / smaller * 100, 2)
+            })
+        results.sort(key=lambda x: (x["overlap"], x["shared"]), reverse=True)
+        return results
+
+    def self_reuse(self, student_id):
+        """Pairs of this student's responses to different quizzes that share fingerprints."""
+        rids = self.by_student.get(student_id)
+        if not rids:
+            return []
+        own = set(rids)
+        pairs = []
+        for rid in own:
+            quiz_id = self.documents[rid]["quiz_id"]
+            for match in self.matches(rid, candidates=own, earlier_only=True):
+                if match["quiz_id"] != quiz_id:
+                    pairs.append((match["response_id"], rid, match["overlap"]))
+        return pairs
@@ -0,0 +1,509 @@
+import ast
+import asyncio
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from typing import Callable, List, Dict, Hashable, Tuple, Union
+
+import config
+from lsh import MinHashLSH
+
+
+# Everything the similarity functions need from one answer, computed once
+# per Response instead of once per pair.
+Fingerprint = namedtuple("Fingerprint", ["answer_hash", "tokens", "signatures", "node_count"])
+
+
+class ASTNormalizer(ast.NodeVisitor):
+    def __init__(self):
+        self.structure = []
+        self.var_counter = 0
+        self.var_map = {}
+
+    def generic_visit(self, node):
+        self.structure.append(type(node).__name__)
+        super().generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id not in self.var_map:
+            self.var_map[node.id] = f"VAR_{self.var_counter}"
+            self.var_counter += 1
+        self.structure.append(f"Name:{self.var_map[node.id]}")
+
+    def visit_Constant(self, node):
+        self.structure.append(f"Const:{type(node.value).__name__}")
+
+
+def normalize_code_ast(code: str) -> List[str]:
+    try:
+        tree = ast.parse(code)
+        normalizer = ASTNormalizer()
+        normalizer.visit(tree)
+        return normalizer.structure
+    except:
+        return []
+
+
+def get_node_signature(node: ast.AST) -> str:
+    if isinstance(node, ast.Name):
+        return "Name"
+    elif isinstance(node, ast.Constant):
+        return f"Const_{type(node.value).__name__}"
+    else:
+        return type(node).__name__
+
+
+def tree_to_list(node: ast.AST) -> List[str]:
+    result = [get_node_signature(node)]
+    for child in ast.iter_child_nodes(node):
+        result.extend(tree_to_list(child))
+    return result
+
+
+def answer_hash(code: str) -> str:
+    return hashlib.sha1((code or "").encode("utf-8")).hexdigest()
+
+
+def fingerprint_code(code: str) -> Fingerprint:
+    code = code or ""
+    try:
+        tree = ast.parse(code)
+        normalizer = ASTNormalizer()
+        normalizer.visit(tree)
+        signatures = tree_to_list(tree)
+    except:
+        # Unparsable answers score 0 against everything, as before.
+        return Fingerprint(answer_hash(code), (), (), 0)
+    return Fingerprint(answer_hash(code), tuple(normalizer.structure), tuple(signatures), len(signatures))
+
+
+def _as_fingerprint(submission: Union[str, Fingerprint]) -> Fingerprint:
+    if isinstance(submission, Fingerprint):
+        return submission
+    return fingerprint_code(submission)
+
+
+# Process-local symbol table; node signatures are persisted as strings and
+# only mapped to small ints for the edit distance engine.
+_SYMBOL_IDS = {}
+
+
+def intern_sequence(sequence) -> List[int]:
+    ids = _SYMBOL_IDS
+    return [ids.setdefault(symbol, len(ids)) for symbol in sequence]
+
+
+def edit_distance(seq1, seq2, max_distance: int = None) -> int:
+    """Levenshtein distance using Hyyro's bit-parallel algorithm.
+
+    Each DP column is held as two bit vectors over the shorter sequence, so
+    memory is O(min(m, n)). When max_distance is given, returns
+    max_distance + 1 as soon as the distance is known to exceed it.
+    """
+    if len(seq1) > len(seq2):
+        seq1, seq2 = seq2, seq1
+    m, n = len(seq1), len(seq2)
+
+    if max_distance is not None and n - m > max_distance:
+        return max_distance + 1
+    if m == 0:
+        return n
+
+    peq = {}
+    for i, symbol in enumerate(seq1):
+        peq[symbol] = peq.get(symbol, 0) | (1 << i)
+
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    vp, vn = full, 0
+    score = m
+
+    for j, symbol in enumerate(seq2):
+        eq = peq.get(symbol, 0)
+        xv = eq | vn
+        xh = ((((eq & vp) + vp) & full) ^ vp) | eq
+        hp = vn | (~(xh | vp) & full)
+        hn = vp & xh
+        if hp & last:
+            score += 1
+        elif hn & last:
+            score -= 1
+        # Each remaining column can lower the score by at most one.
+        if max_distance is not None and score - (n - j - 1) > max_distance:
+            return max_distance + 1
+        hp = ((hp << 1) | 1) & full
+        hn = (hn << 1) & full
+        vp = hn | (~(xv | hp) & full)
+        vn = hp & xv
+
+    return score
+
+
+def tree_edit_distance(tree1: ast.AST, tree2: ast.AST) -> int:
+    return edit_distance(intern_sequence(tree_to_list(tree1)), intern_sequence(tree_to_list(tree2)))
+
+
+def _combined_score(struct_similarity: float, distance: int, max_nodes: int) -> float:
+    tree_similarity = max(0, (1 - distance / max_nodes) * 100) if max_nodes > 0 else 0
+    return round((struct_similarity * 0.6 + tree_similarity * 0.4), 2)
+
+
+def _max_flaggable_distance(struct_similarity: float, max_nodes: int, threshold: float) -> int:
+    # Largest tree edit distance that still lets the pair score above threshold,
+    # or -1 if even identical trees could not get it there.
+    if max_nodes <= 0 or _combined_score(struct_similarity, 0, max_nodes) <= threshold:
+        return -1
+    distance = int(max_nodes * (1 - (threshold - struct_similarity * 0.6) / 40))
+    distance = min(max(distance, 0), max_nodes)
+    while distance < max_nodes and _combined_score(struct_similarity, distance + 1, max_nodes) > threshold:
+        distance += 1
+    while _combined_score(struct_similarity, distance, max_nodes) <= threshold:
+        distance -= 1
+    return distance
+
+
+def _similarity(fp1: Fingerprint, fp2: Fingerprint, threshold: float = None) -> float:
+    # Expects compact fingerprints, whose tokens and signatures are interned ints.
+    try:
+        if not fp1.tokens or not fp2.tokens:
+            return 0.0
+
+        matcher = SequenceMatcher(None, fp1.tokens, fp2.tokens)
+        struct_similarity = matcher.ratio() * 100
+        max_nodes = max(fp1.node_count, fp2.node_count)
+
+        if threshold is None:
+            return _combined_score(struct_similarity, edit_distance(fp1.signatures, fp2.signatures), max_nodes)
+
+        max_distance = _max_flaggable_distance(struct_similarity, max_nodes, threshold)
+        if max_distance < 0:
+            return _combined_score(struct_similarity, 0, max_nodes)
+        distance = edit_distance(fp1.signatures, fp2.signatures, max_distance)
+        return _combined_score(struct_similarity, distance, max_nodes)
+    except:
+        return 0.0
+
+
+def compact_fingerprint(fp: Fingerprint) -> Fingerprint:
+    # Interning is equality preserving, so scores are unchanged, and small
+    # int tuples are far cheaper to ship to worker processes than strings.
+    return Fingerprint(None, tuple(intern_sequence(fp.tokens)), tuple(intern_sequence(fp.signatures)), fp.node_count)
+
+
+def fingerprint_similarity(fp1: Fingerprint, fp2: Fingerprint, threshold: float = None) -> float:
+    """Similarity percentage of two fingerprints.
+
+    With a threshold, scores above it are exact; a pair that cannot beat it
+    gets an upper bound that is <= threshold, without finishing the tree
+    edit distance.
+    """
+    return _similarity(compact_fingerprint(fp1), compact_fingerprint(fp2), threshold)
+
+
+def advanced_similarity(code1: str, code2: str) -> float:
+    return fingerprint_similarity(_as_fingerprint(code1), _as_fingerprint(code2))
+
+
+#Parallel pair scoring
+_POOL = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=config.PLAGIARISM_WORKERS)
+    return _POOL
+
+
+def shutdown_pool():
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(cancel_futures=True)
+        _POOL = None
+
+
+def _score_chunk(fingerprints: Dict[Hashable, Fingerprint], pairs: List[Tuple], threshold: float) -> List[Tuple]:
+    return [(key1, key2, _similarity(fingerprints[key1], fingerprints[key2], threshold)) for key1, key2 in pairs]
+
+
+def _tiled_pairs(keys: List[Hashable]) -> List[Tuple]:
+    # All i < j pairs, ordered block by block so that each chunk only needs
+    # the fingerprints of two blocks of students.
+    size = config.PLAGIARISM_TILE_SIZE
+    pairs = []
+    for bi in range(0, len(keys), size):
+        for bj in range(bi, len(keys), size):
+            for i in range(bi, min(bi + size, len(keys))):
+                for j in range(max(i + 1, bj), min(bj + size, len(keys))):
+                    pairs.append((keys[i], keys[j]))
+    return pairs
+
+
+def _chunks(fingerprints: Dict[Hashable, Fingerprint], pairs: List[Tuple]):
+    chunk_size = config.PLAGIARISM_TILE_SIZE ** 2
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        keys = {key for pair in chunk for key in pair}
+        yield {key: fingerprints[key] for key in keys}, chunk
+
+
+def _use_pool(pair_count: int) -> bool:
+    return config.PLAGIARISM_WORKERS > 1 and pair_count >= config.PLAGIARISM_PARALLEL_MIN_PAIRS
+
+
+def score_pairs(fingerprints: Dict[Hashable, Fingerprint], pairs: List[Tuple], threshold: float = None) -> Dict[Tuple, float]:
+    if not _use_pool(len(pairs)):
+        results = [_score_chunk(fingerprints, pairs, threshold)]
+    else:
+        pool = _get_pool()
+        futures = [pool.submit(_score_chunk, chunk_fps, chunk, threshold) for chunk_fps, chunk in _chunks(fingerprints, pairs)]
+        results = [future.result() for future in futures]
+    return {(key1, key2): sim for chunk in results for key1, key2, sim in chunk}
+
+
+async def score_pairs_async(fingerprints: Dict[Hashable, Fingerprint], pairs: List[Tuple], threshold: float = None,
+                            progress: Callable[[int, int], None] = None) -> Dict[Tuple, float]:
+    loop = asyncio.get_running_loop()
+    if not _use_pool(len(pairs)):
+        # Small jobs are not worth the IPC, but still must not block the event loop.
+        results = [await loop.run_in_executor(None, _score_chunk, fingerprints, pairs, threshold)]
+        if progress:
+            progress(len(pairs), len(pairs))
+    else:
+        pool = _get_pool()
+        futures = [
+            loop.run_in_executor(pool, _score_chunk, chunk_fps, chunk, threshold)
+            for chunk_fps, chunk in _chunks(fingerprints, pairs)
+        ]
+        results = []
+        for future in asyncio.as_completed(futures):
+            results.append(await future)
+            if progress:
+                progress(sum(len(chunk) for chunk in results), len(pairs))
+    return {(key1, key2): sim for chunk in results for key1, key2, sim in chunk}
+
+
+async def compare_pairs_async(fingerprints: Dict[Hashable, Fingerprint], pairs: List[Tuple], threshold: float = None) -> Dict[Tuple, float]:
+    needed = {key for pair in pairs for key in pair}
+    compact = {key: compact_fingerprint(fingerprints[key]) for key in needed}
+    return await score_pairs_async(compact, pairs, threshold)
+
+
+#Quiz-level analysis
+def _summarize(student_ids: List[int], pairwise: List[Dict]) -> Dict:
+    stats = {sid: {"total": 0, "count": 0} for sid in student_ids}
+    for comparison in pairwise:
+        if comparison.get("estimated"):
+            continue
+        for sid in (comparison["student1_id"], comparison["student2_id"]):
+            stats[sid]["total"] += comparison["similarity"]
+            stats[sid]["count"] += 1
+
+    individual = []
+    for sid in student_ids:
+        avg = (
+            stats[sid]["total"] / stats[sid]["count"]
+            if stats[sid]["count"] > 0 else 0
+        )
+        individual.append({
+            "student_id": sid,
+            "avg_similarity": round(avg, 2)
+        })
+
+    return {
+        "pairwise": pairwise,
+        "individual": individual,
+        "flagged_count": sum(1 for x in pairwise if x["flagged"]),
+        "total_comparisons": len(pairwise)
+    }
+
+
+def _plan_submissions(student_codes: Dict[int, Union[str, Fingerprint]], use_lsh: bool, verify_recall: bool) -> Dict:
+    fingerprints = {sid: _as_fingerprint(code) for sid, code in student_codes.items()}
+    student_ids = list(fingerprints.keys())
+    plan = {
+        "student_ids": student_ids,
+        "fingerprints": {sid: compact_fingerprint(fp) for sid, fp in fingerprints.items()},
+        "candidates": None,
+    }
+
+    if use_lsh is None:
+        use_lsh = len(student_ids) >= config.LSH_MIN_SUBMISSIONS
+    if verify_recall is None:
+        verify_recall = config.LSH_VERIFY_RECALL
+    plan["verify_recall"] = use_lsh and verify_recall
+
+    if use_lsh:
+        # Shingles are hashed from the string tokens so candidates do not
+        # depend on this process's interning order.
+        index = MinHashLSH(config.LSH_BANDS, config.LSH_ROWS, config.LSH_SHINGLE_SIZE)
+        plan["signatures"] = {sid: index.signature(fp.tokens) for sid, fp in fingerprints.items()}
+        plan["candidates"] = index.candidate_pairs(plan["signatures"])
+
+    if plan["candidates"] is None or plan["verify_recall"]:
+        plan["pairs"] = _tiled_pairs(student_ids)
+    else:
+        plan["pairs"] = list(plan["candidates"])
+    return plan
+
+
+def _assemble_submissions(plan: Dict, scores: Dict[Tuple, float]) -> Dict:
+    student_ids = plan["student_ids"]
+    candidates = plan["candidates"]
+    flag_threshold = config.PLAGIARISM_FLAG_THRESHOLD
+    threshold = plan["threshold"]
+
+    pairwise = []
+    for i in range(len(student_ids)):
+        for j in range(i + 1, len(student_ids)):
+            id1, id2 = student_ids[i], student_ids[j]
+            if candidates is None or (id1, id2) in candidates:
+                sim = scores[(id1, id2)]
+                comparison = {
+                    "student1_id": id1,
+                    "student2_id": id2,
+                    "similarity": sim,
+                    "flagged": sim > flag_threshold
+                }
+                if threshold is not None and sim <= threshold:
+                    comparison["below_threshold"] = True
+            else:
+                # Skipped by LSH: reported with the MinHash estimate, never flagged.
+                signatures = plan["signatures"]
+                comparison = {
+                    "student1_id": id1,
+                    "student2_id": id2,
+                    "similarity": round(MinHashLSH.estimate(signatures[id1], signatures[id2]) * 100, 2),
+                    "flagged": False,
+                    "below_threshold": True,
+                    "estimated": True
+                }
+            pairwise.append(comparison)
+
+    result = _summarize(student_ids, pairwise)
+    if candidates is not None:
+        result["lsh"] = {
+            "candidates": len(candidates),
+            "pruned": len(pairwise) - len(candidates),
+        }
+    if plan["verify_recall"]:
+        expected = {pair for pair, sim in scores.items() if sim > flag_threshold}
+        found = {(x["student1_id"], x["student2_id"]) for x in pairwise if x["flagged"]}
+        result["lsh"]["recall"] = round(len(found & expected) / len(expected), 4) if expected else 1.0
+        result["lsh"]["missed"] = sorted(expected - found)
+    return result
+
+
+def compare_all_submissions(student_codes: Dict[int, Union[str, Fingerprint]], threshold: float = None,
+                            use_lsh: bool = None, verify_recall: bool = None) -> Dict:
+    plan = _plan_submissions(student_codes, use_lsh, verify_recall)
+    plan["threshold"] = threshold
+    return _assemble_submissions(plan, score_pairs(plan["fingerprints"], plan["pairs"], threshold))
+
+
+#Incremental analysis
+def _lsh_index() -> MinHashLSH:
+    return MinHashLSH(config.LSH_BANDS, config.LSH_ROWS, config.LSH_SHINGLE_SIZE)
+
+
+def _plan_rows(row_ids: List[int], fingerprints: Dict[int, Fingerprint], signatures) -> Tuple[Dict, List[Tuple], Dict]:
+    rows = set(row_ids)
+    settled = [sid for sid in fingerprints if sid not in rows]
+    pairs = []
+    for k, sid in enumerate(row_ids):
+        # Each pair once: against every settled student and the rows before it.
+        for other in settled + row_ids[:k]:
+            pairs.append((sid, other) if sid < other else (other, sid))
+
+    estimates = {}
+    if signatures is not None and len(fingerprints) >= config.LSH_MIN_SUBMISSIONS:
+        index = _lsh_index()
+        for sid, fp in fingerprints.items():
+            if sid in rows or sid not in signatures:
+                signatures[sid] = index.signature(fp.tokens)
+        candidates = []
+        for pair in pairs:
+            sig1, sig2 = signatures[pair[0]], signatures[pair[1]]
+            if index.collides(sig1, sig2):
+                candidates.append(pair)
+            else:
+                estimates[pair] = round(MinHashLSH.estimate(sig1, sig2) * 100, 2)
+        pairs = candidates
+
+    needed = {sid for pair in pairs for sid in pair}
+    compact = {sid: compact_fingerprint(fingerprints[sid]) for sid in needed}
+    return compact, pairs, estimates
+
+
+async def score_rows_async(row_ids: List[int], fingerprints: Dict[int, Fingerprint], signatures=None,
+                           progress: Callable[[int, int], None] = None) -> Dict[Tuple, Tuple]:
+    """Score every pair that involves one of row_ids, keyed (low id, high id).
+
+    Values are (similarity, estimated). When a signatures mapping is given
+    it caches MinHash signatures, and quizzes with at least
+    LSH_MIN_SUBMISSIONS answers only score LSH candidates exactly. With
+    SIMILARITY_THRESHOLD set, pairs at or below it hold an upper bound and
+    count as estimated too. LSH_VERIFY_RECALL scores the skipped pairs as
+    well and reports the flagged ones LSH missed.
+    """
+    compact, pairs, estimates = _plan_rows(list(row_ids), fingerprints, signatures)
+    verify = bool(estimates) and config.LSH_VERIFY_RECALL
+    if verify:
+        for sid in {sid for pair in estimates for sid in pair} - compact.keys():
+            compact[sid] = compact_fingerprint(fingerprints[sid])
+        pairs = pairs + list(estimates)
+    threshold = min(config.SIMILARITY_THRESHOLD, config.PLAGIARISM_FLAG_THRESHOLD) or None
+    scores = await score_pairs_async(compact, pairs, threshold, progress=progress)
+    if verify:
+        missed = sum(1 for pair in estimates if scores[pair] > config.PLAGIARISM_FLAG_THRESHOLD)
+        print(f"LSH missed {missed} flagged pairs among {len(estimates)} it skipped")
+        estimates = {}
+    result = {pair: (sim, threshold is not None and sim <= threshold) for pair, sim in scores.items()}
+    result.update({pair: (sim, True) for pair, sim in estimates.items()})
+    return result
+
+
+#Cross-quiz analysis
+CROSS_QUIZ_THRESHOLD = 50
+
+
+def _plan_across_quizzes(quiz_submissions: Dict[int, Dict[int, Union[str, Fingerprint]]]) -> Tuple[Dict, List[Tuple]]:
+    fingerprints = {
+        (qid, sid): compact_fingerprint(_as_fingerprint(code))
+        for qid, submissions in quiz_submissions.items()
+        for sid, code in submissions.items()
+    }
+    quiz_ids = list(quiz_submissions.keys())
+    pairs = []
+    for student_id in {sid for q in quiz_submissions.values() for sid in q}:
+        for i in range(len(quiz_ids)):
+            for j in range(i + 1, len(quiz_ids)):
+                q1, q2 = quiz_ids[i], quiz_ids[j]
+                if student_id in quiz_submissions[q1] and student_id in quiz_submissions[q2]:
+                    pairs.append(((q1, student_id), (q2, student_id)))
+    return fingerprints, pairs
+
+
+def _assemble_across_quizzes(pairs: List[Tuple], scores: Dict[Tuple, float]) -> Dict:
+    results = []
+    for (q1, student_id), (q2, _) in pairs:
+        sim = scores[((q1, student_id), (q2, student_id))]
+        if sim > CROSS_QUIZ_THRESHOLD:
+            results.append({
+                "student_id": student_id,
+                "quiz1": q1,
+                "quiz2": q2,
+                "similarity": sim,
+                "flagged": sim > config.PLAGIARISM_FLAG_THRESHOLD
+            })
+
+    return {
+        "cross_quiz_comparisons": results,
+        "high_similarity_count": len(results)
+    }
+
+
+def compare_across_quizzes(quiz_submissions: Dict[int, Dict[int, Union[str, Fingerprint]]]) -> Dict:
+    fingerprints, pairs = _plan_across_quizzes(quiz_submissions)
+    return _assemble_across_quizzes(pairs, score_pairs(fingerprints, pairs, CROSS_QUIZ_THRESHOLD))
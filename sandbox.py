@@ -0,0 +1,140 @@
+import asyncio
+import ast
+import os
+import re
+import shutil
+import signal
+import sys
+import tempfile
+from collections import namedtuple
+
+import config
+
+
+RunResult = namedtuple("RunResult", ["status", "stdout", "detail"])#status: ok, syntax_error, timeout, error
+
+# language -> (file suffix, interpreter looked up on PATH, syntax check command or None for in-process)
+RUNNERS = {
+    "python": (".py", None, None),
+    "javascript": (".js", "node", ["--check"]),
+}
+ALIASES = {"py": "python", "python3": "python", "js": "javascript", "node": "javascript", "nodejs": "javascript"}
+
+_slots = None
+_slots_loop = None
+
+
+def runner_for(languages):
+    """The runner named by a quiz's languages field, and whether it is the only language allowed"""
+    names = [ALIASES.get(name, name) for name in re.findall(r"[a-z0-9+#]+", (languages or "").lower())]
+    names = [name for name in names if name not in ("any", "none")]
+    if len(names) == 1 and names[0] in RUNNERS and available(names[0]):
+        return names[0], True
+    if not names or "python" in names:
+        return "python", False
+    return None, False
+
+
+def available(language):
+    interpreter = RUNNERS[language][1]
+    return interpreter is None or shutil.which(interpreter) is not None
+
+
+def isolation_available():
+    """Code is only ever run under bubblewrap, with limits applied by prlimit"""
+    return shutil.which(config.SANDBOX_BWRAP) is not None and shutil.which("prlimit") is not None
+
+
+def _install_dir(binary):
+    # The directory holding bin/ and lib/ for an interpreter, e.g. /usr or a pyenv version.
+    return os.path.dirname(os.path.dirname(os.path.realpath(binary)))
+
+
+def _isolated(command, boxdir):
+    """command run as nobody in fresh namespaces: no network, other processes or host files
+    beyond read-only system and interpreter directories, and only boxdir at /sandbox"""
+    prlimit = shutil.which("prlimit")
+    memory = config.SANDBOX_MEMORY_MB * 1024 * 1024
+    output = config.SANDBOX_MAX_OUTPUT_KB * 1024
+    cpu = int(config.SANDBOX_TIMEOUT) + 1
+    wrapped = [
+        shutil.which(config.SANDBOX_BWRAP),
+        "--unshare-all", "--die-with-parent", "--new-session", "--clearenv",
+        "--uid", "65534", "--gid", "65534",
+        "--setenv", "PATH", "/usr/bin:/bin", "--setenv", "HOME", "/sandbox",
+        "--proc", "/proc", "--dev", "/dev", "--tmpfs", "/tmp",
+    ]
+    readable = ["/usr", "/bin", "/lib", "/lib64", "/etc/alternatives", _install_dir(prlimit), _install_dir(command[0])]
+    for path in dict.fromkeys(readable):
+        wrapped += ["--ro-bind-try", path, path]
+    wrapped += ["--ro-bind", boxdir, "/sandbox", "--chdir", "/sandbox", "--"]
+    wrapped += [
+        prlimit, f"--cpu={cpu}", f"--data={memory}", f"--fsize={output}",
+        f"--nproc={config.SANDBOX_MAX_PROCESSES}", "--core=0", "--",
+    ]
+    return wrapped + command
+
+
+async def _exec(command, workdir, timeout):
+    # Output goes to files outside the box so RLIMIT_FSIZE caps it and the code cannot reach them by path.
+    with open(os.path.join(workdir, "stdout"), "wb") as stdout, open(os.path.join(workdir, "stderr"), "wb") as stderr:
+        process = await asyncio.create_subprocess_exec(
+            *_isolated(command, os.path.join(workdir, "box")),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=stdout,
+            stderr=stderr,
+            env={},
+            start_new_session=True,
+        )
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            process.kill()
+        await process.wait()
+        return None
+    return process.returncode
+
+
+def _read(workdir, name):
+    with open(os.path.join(workdir, name), "rb") as f:
+        text = f.read(config.SANDBOX_MAX_OUTPUT_KB * 1024).decode("utf-8", "replace")
+    return text.replace("/sandbox/", "")
+
+
+async def run_code(language, code):
+    """Run code once, isolated by bubblewrap, with CPU, memory, output and process limits"""
+    global _slots, _slots_loop
+    if not isolation_available():
+        raise RuntimeError(f"{config.SANDBOX_BWRAP} and prlimit are needed to run submitted code")
+    if _slots_loop is not asyncio.get_running_loop():
+        _slots = asyncio.Semaphore(config.SANDBOX_WORKERS)
+        _slots_loop = asyncio.get_running_loop()
+    suffix, interpreter, check = RUNNERS[language]
+
+    if interpreter is None:
+        try:
+            ast.parse(code)
+        except (SyntaxError, ValueError) as e:
+            return RunResult("syntax_error", "", f"line {getattr(e, 'lineno', '?')}: {getattr(e, 'msg', e)}")
+        command = [os.path.realpath(sys.executable), "-I", "main" + suffix]
+    else:
+        command = [os.path.realpath(shutil.which(interpreter)), "main" + suffix]
+
+    async with _slots:
+        with tempfile.TemporaryDirectory(prefix="codehive-") as workdir:
+            os.mkdir(os.path.join(workdir, "box"))
+            with open(os.path.join(workdir, "box", "main" + suffix), "w") as f:
+                f.write(code)
+            if check is not None:
+                returncode = await _exec([command[0]] + check + command[1:], workdir, config.SANDBOX_TIMEOUT)
+                if returncode:
+                    return RunResult("syntax_error", "", _read(workdir, "stderr").strip()[-500:])
+            returncode = await _exec(command, workdir, config.SANDBOX_TIMEOUT)
+            if returncode is None:
+                return RunResult("timeout", _read(workdir, "stdout"), f"did not finish within {config.SANDBOX_TIMEOUT:g} seconds")
+            if returncode != 0:
+                return RunResult("error", _read(workdir, "stdout"), _read(workdir, "stderr").strip()[-500:])
+            return RunResult("ok", _read(workdir, "stdout"), "")
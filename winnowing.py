@@ -0,0 +1,36 @@
+import zlib
+from typing import List, Sequence, Tuple
+
+
+def kgram_hashes(tokens: Sequence[str], k: int) -> List[int]:
+    if not tokens:
+        return []
+    if len(tokens) <= k:
+        return [zlib.crc32("\x1f".join(tokens).encode("utf-8"))]
+    return [
+        zlib.crc32("\x1f".join(tokens[i:i + k]).encode("utf-8"))
+        for i in range(len(tokens) - k + 1)
+    ]
+
+
+def winnow(hashes: Sequence[int], window: int) -> List[Tuple[int, int]]:
+    """Robust winnowing (Schleimer, Wilkerson and Aiken, as used by MOSS).
+
+    Picks the minimum hash of every window of consecutive k-gram hashes,
+    the rightmost one on ties, and records each pick once as (hash, position).
+    Any shared run of window + k - 1 tokens is guaranteed to share a pick.
+    """
+    if not hashes:
+        return []
+    window = min(window, len(hashes))
+    selected = []
+    last = -1
+    for start in range(len(hashes) - window + 1):
+        best = start
+        for i in range(start + 1, start + window):
+            if hashes[i] <= hashes[best]:
+                best = i
+        if best != last:
+            selected.append((hashes[best], best))
+            last = best
+    return selected